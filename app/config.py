@@ -2,11 +2,78 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     max_file_size_mb: int = 10
+    max_frames: int = 50
+    exif_max_value_bytes: int = 256
     supported_formats: list[str] = [
         "image/jpeg", "image/png", "image/gif", "image/bmp", "image/webp", "image/tiff"
     ]
     rate_limit: str = "10/minute" 
-    cache_size: int = 100  
+    batch_rate_limit: str = "500/minute"
+    rate_limit_mb_per_token: float = 1.0
+    rate_limit_db_path: str = "/tmp/ocr_rate_limit.sqlite3"
+    rate_limit_redis_url: str = ""
+    batch_max_images: int = 100
+    batch_concurrency: int = 4
+    admission_enabled: bool = True
+    admission_initial_limit: int = 8
+    admission_min_limit: int = 1
+    admission_max_limit: int = 64
+    admission_max_queue: int = 64
+    admission_latency_tolerance: float = 2.0
+    deadline_header: str = "X-Request-Timeout"
+    default_request_timeout_seconds: float = 0.0
+    profiling_sample_rate: float = 0.0
+    profiling_token: str = ""
+    profiling_header: str = "X-Debug-Token"
+    profiling_interval_ms: float = 5.0
+    profiling_tracemalloc: bool = True
+    profiling_dir: str = "/tmp/ocr_profiles"
+    profiling_max_profiles: int = 100
+    jobs_rate_limit: str = "500/minute"
+    jobs_workers: int = 2
+    jobs_max_queue: int = 16
+    jobs_max_pending_mb: int = 256
+    jobs_max_retained: int = 1000
+    cache_memory_max_mb: int = 64
+    cache_disk_max_mb: int = 512
+    cache_ttl_seconds: int = 7 * 24 * 3600
+    cache_db_path: str = "/tmp/ocr_cache.sqlite3"
+    layout_cache_max_mb: int = 16
+    ocr_engine: str = "vision"
+    tesseract_cmd: str = "tesseract"
+    tesseract_lang: str = "eng"
+    tesseract_workers: int = 0
+    tesseract_timeout_seconds: float = 30.0
+    routing_min_confidence: float = 0.8
+    stub_latency_ms: int = 0
+    warmup_enabled: bool = True
+    warmup_timeout_seconds: float = 10.0
     vision_retry_attempts: int = 3
+    vision_retry_base_ms: int = 200
+    vision_retry_max_ms: int = 5000
+    vision_retry_budget_ratio: float = 0.2
+    vision_retry_budget_reserve: int = 10
+    vision_hedge_enabled: bool = False
+    vision_hedge_min_samples: int = 20
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 30.0
+    vision_max_concurrency: int = 8
+    vision_batch_window_ms: int = 0
+    vision_batch_max_size: int = 16
+    vision_preprocess: bool = False
+    vision_max_side: int = 2048
+    vision_grayscale: bool = True
+    vision_format: str = "JPEG"
+    vision_jpeg_quality: int = 90
+    blank_check_enabled: bool = True
+    blank_max_stddev: float = 1.0
+    blank_min_edge_ratio: float = 0.0005
+    near_dup_enabled: bool = False
+    near_dup_hash_size: int = 16
+    near_dup_max_distance: int = 10
+    near_dup_max_entries: int = 10000
+    cpu_pool_kind: str = "thread"
+    cpu_pool_size: int = 0
+    cpu_pool_max_queue: int = 64
 
 settings = Settings()
\ No newline at end of file
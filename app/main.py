@@ -1,29 +1,71 @@
-from fastapi import FastAPI, UploadFile, File, status, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, status, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import time
 import asyncio
-import hashlib
+import threading
 import structlog
-from typing import List
-from app.services.ocr import cached_extract
-from app.utils.validators import validate_image, preprocess_text
-from app.utils.exceptions import ValidationError
-from app.middleware.rate_limiter import limiter, SlowAPIMiddleware
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, List, Literal
+from app.services.ocr import extract, iter_extract, open_client, close_client, get_stats, backend, warm_up
+from app.services.jobs import JobManager
+from app.services.admission import AdmissionController, Ticket
+from app.utils import validators
+from app.utils.validators import validate_image, preprocess_text, sanitize_words
+from app.utils.imaging import split_pages
+from app.utils.exceptions import (
+    ValidationError, ForbiddenError, NotFoundError, RateLimitError, ServiceUnavailableError
+)
+from app.utils.cpu_pool import cpu_pool
+from app.utils import deadline, metrics
+from app.utils.serialization import FastJSONResponse, envelope
+from app.utils.streaming import MEDIA_TYPES, encode_event, stream_format
+from app.middleware.profiling import profiler
+from app.middleware.rate_limiter import limiter
 from app.config import settings
 
 logger = structlog.get_logger(__name__)
 
+# Set once warm-up has finished; /health reports 503 until then.
+ready = threading.Event()
+
+async def warm_up_all():
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(warm_up, settings.warmup_timeout_seconds)
+        await cpu_pool.run(validators.warm_up)
+    except Exception as e:
+        # Requests still work without warm-up; they just pay for it themselves.
+        logger.warning("warmup_failed", error=str(e))
+    ready.set()
+    logger.info("warmup_complete", duration_ms=int((time.perf_counter() - start) * 1000))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    open_client()
+    await jobs.start()
+    # Warm-up runs in the background so the server accepts connections
+    # (and answers readiness probes) while the Vision channel connects.
+    warmup = asyncio.create_task(warm_up_all()) if settings.warmup_enabled else None
+    if warmup is None:
+        ready.set()
+    yield
+    if warmup is not None:
+        await warmup
+    ready.clear()
+    await jobs.stop()
+    close_client()
+    cpu_pool.shutdown()
+
 app = FastAPI(
     title="OCR API", 
     version="1.0",
     docs_url="/", 
-    redoc_url=None  
+    redoc_url=None,
+    lifespan=lifespan
 )
 
-app.state.limiter = limiter
-app.add_middleware(SlowAPIMiddleware)
-
 class APIResponse(BaseModel):
     success: bool
     status_code: int
@@ -39,53 +81,251 @@ class OCRData(BaseModel):
 class BatchResult(BaseModel):
     results: List[dict]
 
+LAYOUT_DESCRIPTION = "Include word boxes and confidences as columns (Vision engine only)"
+FIELDS_DESCRIPTION = "Comma-separated result fields to return, e.g. `text,confidence`"
+LEAN_DESCRIPTION = "Leave out `metadata` (with EXIF) and `timings_ms`"
+
+# Keys of a result that `fields` can select. Errors and the page number
+# of streamed pages are always kept.
+RESULT_FIELDS = frozenset({"text", "confidence", "processing_time_ms", "metadata", "layout", "pages", "timings_ms"})
+ALWAYS_KEPT = frozenset({"error", "page"})
+
+admission = AdmissionController(
+    settings.admission_initial_limit,
+    settings.admission_min_limit,
+    settings.admission_max_limit,
+    settings.admission_max_queue,
+    settings.admission_latency_tolerance,
+    enabled=settings.admission_enabled,
+)
+
 @app.exception_handler(ValidationError)
-async def validation_handler(request: Request, exc: ValidationError):
-    response_data = APIResponse(
-        success=False, 
-        status_code=exc.status_code, 
-        error=exc.detail["error"]
+@app.exception_handler(ForbiddenError)
+@app.exception_handler(NotFoundError)
+@app.exception_handler(RateLimitError)
+@app.exception_handler(ServiceUnavailableError)
+async def api_error_handler(request: Request, exc: HTTPException):
+    return FastJSONResponse(
+        envelope(None, exc.status_code, exc.detail["error"]), status_code=exc.status_code, headers=exc.headers
     )
-    return JSONResponse(content=response_data.dict(), status_code=exc.status_code)
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logger.error("unhandled_exception", exc=str(exc))
-    response_data = APIResponse(
-        success=False, 
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        error="Internal server error"
+    return FastJSONResponse(
+        envelope(None, status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal server error"), status_code=500
     )
-    return JSONResponse(content=response_data.dict(), status_code=500)
 
 @app.middleware("http")
 async def metrics_middleware(request: Request, call_next):
-    start = time.time()
+    start = time.perf_counter()
     response = await call_next(request)
-    duration = time.time() - start
+    duration = time.perf_counter() - start
+    # The route template keeps label cardinality bounded (no job ids).
+    route = request.scope.get("route")
+    metrics.request_seconds.observe(
+        duration, method=request.method, route=route.path if route else "unmatched", status=response.status_code
+    )
     logger.info("request_processed", method=request.method, url=str(request.url), duration=duration)
+    quota = getattr(request.state, "quota", None)
+    if quota is not None:
+        response.headers.update(quota.headers())
+    return response
+
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    reason = profiler.reason(request)
+    if reason is None:
+        return await call_next(request)
+    with profiler.profile(request, reason) as profile:
+        response = await call_next(request)
+        if profile is not None:
+            profile["status"] = response.status_code
+    if profile is None:
+        return response
+    try:
+        await asyncio.to_thread(profiler.finish, profile)
+    except OSError as e:
+        logger.warning("profile_save_failed", error=str(e))
+        return response
+    logger.info("request_profiled", profile_id=profile["id"], reason=reason, duration_ms=profile["duration_ms"])
+    response.headers["X-Profile-Id"] = profile["id"]
     return response
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
+    vision = backend.health()
+    if not ready.is_set():
+        return JSONResponse({"status": "starting", "vision": vision}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {"status": "healthy" if vision["circuit"] == "closed" else "degraded", "vision": vision}
 
-async def process_single_image(image: UploadFile):
-    from app.utils.exceptions import ValidationError
+@app.get("/stats")
+async def stats():
+    return {
+        "ocr": get_stats(),
+        "cpu_pool": cpu_pool.stats(),
+        "jobs": jobs.stats(),
+        "admission": admission.stats(),
+        "profiling": profiler.stats(),
+    }
 
-    try:
-        content, metadata = await validate_image(image)
-        image_hash = hashlib.sha256(content).hexdigest()
-        text, confidence = cached_extract(image_hash, content)  
-        text = preprocess_text(text)  
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    ocr = get_stats()
+    metrics.in_flight.set(ocr["in_flight"])
+    metrics.cpu_pool_queued.set(cpu_pool.stats()["queued"])
+    metrics.jobs_queued.set(jobs.stats()["queued"])
+    metrics.circuit_open.set(int(ocr["backend"]["circuit"] != "closed"))
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+def response_fields(fields: str | None, lean: bool) -> frozenset[str] | None:
+    """Result keys to return for the ``fields`` and ``lean`` options, or
+    None to return everything."""
+    if fields:
+        keep = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = keep - RESULT_FIELDS
+        if unknown:
+            raise ValidationError(
+                f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(sorted(RESULT_FIELDS))}"
+            )
+        return frozenset(keep) | ALWAYS_KEPT
+    if lean:
+        return (RESULT_FIELDS | ALWAYS_KEPT) - {"metadata", "timings_ms"}
+    return None
+
+def select(data: dict, keep: frozenset[str] | None) -> dict:
+    return data if keep is None else {key: value for key, value in data.items() if key in keep}
+
+def respond(data: dict, timings: dict[str, float], keep: frozenset[str] | None = None) -> FastJSONResponse:
+    # Built as plain dicts and encoded once; the response_model on the
+    # routes only documents the shape.
+    if keep is None or "timings_ms" in keep:
+        data["timings_ms"] = metrics.timings_ms(timings)
+    with metrics.timer("serialization"):
+        return FastJSONResponse(envelope(data))
+
+async def build_result(result: dict, metadata: dict, layout: bool = False) -> dict:
+    extras = {key: result[key] for key in ("bytes_saved", "skipped_reason", "near_duplicate_of") if key in result}
+    if extras:
+        metadata = {**metadata, **extras}
+    with metrics.timer("postprocess"):
+        text = await cpu_pool.run(preprocess_text, result["text"])
         data = {
             "text": text,
-            "confidence": confidence,
+            "confidence": result["confidence"],
             "processing_time_ms": 0,
-            "metadata": metadata 
+            "metadata": metadata
         }
-        return data
-    except ValidationError as e:
+        if layout:
+            # None when the engine does not report word boxes.
+            data["layout"] = result.get("layout")
+            if data["layout"] is not None:
+                words = await cpu_pool.run(sanitize_words, data["layout"]["words"]["text"])
+                data["layout"] = {**data["layout"], "words": {**data["layout"]["words"], "text": words}}
+    return data
+
+async def validate_uploads(images: List[UploadFile]) -> tuple[list[dict | None], list[tuple]]:
+    """Validates every upload. Returns a result slot per image, already
+    holding an error for invalid ones, and ``(index, hash, content, metadata)``
+    for the valid ones."""
+    # At most one upload per pool worker at a time, so a large batch does
+    # not push the pool queue of every other request back.
+    slots = asyncio.Semaphore(cpu_pool.size)
+
+    async def validate(image: UploadFile):
+        async with slots:
+            return await validate_image(image)
+
+    validated = await asyncio.gather(*[validate(img) for img in images], return_exceptions=True)
+    processed: list[dict | None] = [None] * len(images)
+    items = []
+    for index, result in enumerate(validated):
+        if isinstance(result, Exception):
+            processed[index] = {"error": _error_message(result)}
+            continue
+        content, metadata, image_hash = result
+        items.append((index, image_hash, content, metadata))
+    return processed, items
+
+async def iter_results(
+    items: list[tuple], start_time: float, pages: bool = False, layout: bool = False
+) -> AsyncIterator[tuple[int, dict]]:
+    """OCRs validated items, yielding ``(index, data)`` as each completes.
+    Multi-frame images are split into pages that are OCR'd alongside the
+    other items and combined into one result; with ``pages`` set, each
+    page is also yielded as it completes. With ``layout`` set, results
+    carry their word layout."""
+    work, documents, elapsed = [], {}, {}
+    for index, image_hash, content, metadata in items:
+        if metadata.get("frames", 1) > 1:
+            try:
+                split = await cpu_pool.run(split_pages, content)
+            except Exception as e:
+                # verify() does not decode frames, so a truncated document
+                # only fails here; it fails alone, not the whole request.
+                logger.error("ocr_processing_error", error=str(e))
+                yield index, {
+                    "error": f"OCR processing failed: {_error_message(e)}",
+                    "processing_time_ms": int((time.perf_counter() - start_time) * 1000),
+                }
+                continue
+            documents[index] = (metadata, len(split), [])
+            work += [(index, number, {}, page_hash, page) for number, (page_hash, page) in enumerate(split, 1)]
+        else:
+            work.append((index, None, metadata, image_hash, content))
+
+    async for work_index, result in iter_extract([(h, c) for *_, h, c in work], settings.batch_concurrency, layout):
+        index, page_number, metadata, image_hash, _ = work[work_index]
+        if isinstance(result, Exception):
+            logger.error("ocr_processing_error", error=str(result))
+            data = {"error": f"OCR processing failed: {_error_message(result)}"}
+        else:
+            data = await build_result(result, metadata, layout)
+        # Duplicates in one request share a single OCR call, so report one time.
+        data["processing_time_ms"] = elapsed.setdefault(image_hash, int((time.perf_counter() - start_time) * 1000))
+        if page_number is None:
+            yield index, data
+            continue
+
+        metadata, expected, done = documents[index]
+        page = {"page": page_number, **data}
+        if not page.get("metadata"):
+            page.pop("metadata", None)
+        done.append(page)
+        if pages:
+            yield index, page
+        if len(done) == expected:
+            yield index, combine_pages(done, metadata, data["processing_time_ms"])
+
+def combine_pages(pages: list[dict], metadata: dict, processing_time_ms: int) -> dict:
+    pages = sorted(pages, key=lambda page: page["page"])
+    read = [page for page in pages if page.get("text")]
+    return {
+        "text": " ".join(page["text"] for page in read),
+        "confidence": round(sum(page["confidence"] for page in read) / len(read), 2) if read else 0.0,
+        "processing_time_ms": processing_time_ms,
+        "metadata": metadata,
+        "pages": pages,
+    }
+
+async def process_document(image_hash: str, content: bytes, metadata: dict, layout: bool = False) -> dict:
+    async for _, data in iter_results([(0, image_hash, content, metadata)], time.perf_counter(), layout=layout):
+        document = data
+    if "error" in document:
+        raise ValidationError(document["error"])
+    errors = [page["error"] for page in document["pages"] if "error" in page]
+    if len(errors) == len(document["pages"]):
+        raise ValidationError(errors[0])
+    return document
+
+async def process_single_image(image: UploadFile, layout: bool = False):
+    try:
+        content, metadata, image_hash = await validate_image(image)
+        if metadata["frames"] > 1:
+            return await process_document(image_hash, content, metadata, layout)
+        result = await extract(image_hash, content, layout)
+        return await build_result(result, metadata, layout)
+    except HTTPException as e:
         raise e
     except Exception as e:
         logger.error("ocr_processing_error", error=str(e))
@@ -120,13 +360,43 @@ async def process_single_image(image: UploadFile):
         }
     }
 )
-@limiter.limit(settings.rate_limit)
-async def extract_text(request:Request, image: UploadFile = File(...)):  
-    start_time = time.time()
-    data = await process_single_image(image)
-    data["processing_time_ms"] = int((time.time() - start_time) * 1000)
-    response_data = APIResponse(success=True, status_code=status.HTTP_200_OK, data=data)
-    return response_data
+async def extract_text(
+    request:Request,
+    image: UploadFile = File(...),
+    stream: Literal["ndjson", "sse"] | None = Query(None, description="Stream each page as soon as it is ready"),
+    layout: bool = Query(False, description=LAYOUT_DESCRIPTION),
+    fields: str | None = Query(None, description=FIELDS_DESCRIPTION),
+    lean: bool = Query(False, description=LEAN_DESCRIPTION)
+):  
+    await limiter.check(request, "extract", [image])
+    cpu_pool.check()
+    keep = response_fields(fields, lean)
+    start_time = time.perf_counter()
+    client = request.client.host if request.client else "unknown"
+    timeout = request_timeout(request)
+    fmt = stream_format(request.headers.get("accept"), stream)
+    if fmt:
+        content, metadata, image_hash = await validate_image(image)
+        items = [(0, image_hash, content, metadata)]
+        # Admit before the response starts so overload is still a 503; the
+        # stream holds the slot until its last event is sent.
+        slot = AsyncExitStack()
+        with deadline.deadline(timeout):
+            when = deadline.current()
+            ticket = await slot.enter_async_context(admission.admit(client))
+        return StreamingResponse(
+            admitted(stream_results(fmt, [None], items, start_time, layout, keep), slot, ticket, when),
+            media_type=MEDIA_TYPES[fmt],
+            # Frees the slot when the client leaves before the stream starts.
+            background=BackgroundTask(slot.aclose),
+        )
+
+    with metrics.collect_timings() as timings, deadline.deadline(timeout):
+        async with admission.admit(client) as ticket:
+            data = await process_single_image(image, layout)
+            ticket.backend_seconds = timings.get("vision_rpc")
+        data["processing_time_ms"] = int((time.perf_counter() - start_time) * 1000)
+        return respond(select(data, keep), timings, keep)
 
 @app.post(
     "/batch-extract",
@@ -162,20 +432,128 @@ async def extract_text(request:Request, image: UploadFile = File(...)):
         }
     }
 )
-@limiter.limit("5/minute")  
-async def batch_extract(request:Request, images: List[UploadFile] = File(...)): 
-    from app.utils.exceptions import ValidationError  
-
-    if len(images) > 10:  
-        raise ValidationError("Max 10 images per batch.")
-    tasks = [process_single_image(img) for img in images]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    processed = []
-    for result in results:
-        if isinstance(result, Exception):
-            processed.append({"error": str(result)})
-        else:
-            result["processing_time_ms"] = 100
-            processed.append(result)
-    response_data = APIResponse(success=True, status_code=status.HTTP_200_OK, data={"results": processed})
-    return response_data
\ No newline at end of file
+async def batch_extract(
+    request:Request,
+    images: List[UploadFile] = File(...),
+    stream: Literal["ndjson", "sse"] | None = Query(None, description="Stream each result as soon as it is ready"),
+    layout: bool = Query(False, description=LAYOUT_DESCRIPTION),
+    fields: str | None = Query(None, description=FIELDS_DESCRIPTION),
+    lean: bool = Query(False, description=LEAN_DESCRIPTION)
+): 
+    if len(images) > settings.batch_max_images:
+        raise ValidationError(f"Max {settings.batch_max_images} images per batch.")
+    await limiter.check(request, "batch", images)
+    cpu_pool.check()
+    keep = response_fields(fields, lean)
+
+    start_time = time.perf_counter()
+    with metrics.collect_timings() as timings:
+        processed, items = await validate_uploads(images)
+        fmt = stream_format(request.headers.get("accept"), stream)
+        if fmt:
+            return StreamingResponse(
+                stream_results(fmt, processed, items, start_time, layout, keep), media_type=MEDIA_TYPES[fmt]
+            )
+
+        async for index, data in iter_results(items, start_time, layout=layout):
+            processed[index] = select(data, keep)
+        return respond({"results": processed}, timings, keep)
+
+async def stream_results(
+    fmt: str, processed: list[dict | None], items: list[tuple], start_time: float, layout: bool = False,
+    keep: frozenset[str] | None = None,
+):
+    # Validation failures are known up front; OCR results and the pages of
+    # multi-frame images follow in completion order.
+    for index, data in enumerate(processed):
+        if data is not None:
+            yield encode_event(fmt, {"index": index, **data})
+    async for index, data in iter_results(items, start_time, pages=True, layout=layout):
+        event = "page" if "page" in data else "result"
+        yield encode_event(fmt, {"index": index, **select(data, keep)}, event=event)
+    if fmt == "sse":
+        yield encode_event(fmt, {"total": len(processed)}, event="done")
+
+async def admitted(
+    events: AsyncIterator[bytes], slot: AsyncExitStack, ticket: Ticket, when: float | None
+) -> AsyncIterator[bytes]:
+    """Sends ``events`` under the request deadline ``when``, releasing the
+    admission slot held by ``slot`` once the stream ends."""
+    with metrics.collect_timings() as timings, deadline.until(when):
+        async with slot:
+            async for event in events:
+                yield event
+            ticket.backend_seconds = timings.get("vision_rpc")
+
+def request_timeout(request: Request) -> float | None:
+    """Seconds the client is willing to wait, from the deadline header."""
+    value = request.headers.get(settings.deadline_header)
+    if value is None:
+        return settings.default_request_timeout_seconds or None
+    try:
+        timeout = float(value)
+    except ValueError:
+        raise ValidationError(f"Invalid {settings.deadline_header} header: {value}")
+    if timeout <= 0:
+        raise ValidationError(f"{settings.deadline_header} must be positive.")
+    return timeout
+
+def _error_message(exc: Exception) -> str:
+    if isinstance(exc, HTTPException):
+        return exc.detail["error"]
+    return str(exc)
+
+jobs = JobManager(
+    iter_results, settings.jobs_workers, settings.jobs_max_queue, settings.jobs_max_retained,
+    settings.jobs_max_pending_mb * 1024 * 1024,
+)
+
+@app.post("/jobs", response_model=APIResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_job(request: Request, images: List[UploadFile] = File(...)):
+    if len(images) > settings.batch_max_images:
+        raise ValidationError(f"Max {settings.batch_max_images} images per job.")
+    await limiter.check(request, "jobs", images)
+    cpu_pool.check()
+    # Refuse before the uploads are read, hashed and decoded.
+    jobs.check(sum(image.size or 0 for image in images))
+
+    processed, items = await validate_uploads(images)
+    job = jobs.submit(processed, items, sum(len(content) for _, _, content, _ in items))
+    data = {key: job[key] for key in ("job_id", "status", "total", "completed")}
+    return FastJSONResponse(envelope(data, status.HTTP_202_ACCEPTED), status_code=status.HTTP_202_ACCEPTED)
+
+@app.get("/jobs/{job_id}", response_model=APIResponse)
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise NotFoundError(f"Job {job_id} not found.")
+    return FastJSONResponse(envelope(job))
+
+def require_debug_token(request: Request) -> None:
+    # Without a configured token the admin endpoints do not exist.
+    if not profiler.token:
+        raise NotFoundError("Not found.")
+    if not profiler.authorized(request):
+        raise ForbiddenError(f"Missing or invalid {profiler.header} header.")
+
+@app.get("/admin/profiles", include_in_schema=False)
+async def list_profiles(request: Request):
+    require_debug_token(request)
+    profiles = await asyncio.to_thread(profiler.store.list)
+    return FastJSONResponse(envelope({"profiles": profiles}))
+
+@app.get("/admin/profiles/{profile_id}", include_in_schema=False)
+async def download_profile(
+    request: Request,
+    profile_id: str,
+    format: Literal["json", "collapsed"] = Query("json", description="`collapsed` stacks feed flame graph tools")
+):
+    require_debug_token(request)
+    profile = await asyncio.to_thread(profiler.store.get, profile_id)
+    if profile is None:
+        raise NotFoundError(f"Profile {profile_id} not found.")
+    filename = f"profile-{profile_id}.{'txt' if format == 'collapsed' else 'json'}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format == "collapsed":
+        return PlainTextResponse(profile["stacks"], headers=headers)
+    return FastJSONResponse(profile, headers=headers)
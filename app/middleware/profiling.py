@@ -0,0 +1,261 @@
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+import structlog
+from fastapi import Request
+from app.config import settings
+
+logger = structlog.get_logger(__name__)
+
+# Leaf frames of threads that are parked, not working: idle executor
+# workers, the event loop waiting for I/O and condition waits.
+IDLE_FRAMES = {("thread.py", "_worker"), ("selectors.py", "select"), ("threading.py", "wait")}
+
+# Never sampled: probes, scrapes and the profile downloads themselves.
+UNSAMPLED_PREFIXES = ("/admin", "/health", "/metrics")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class StackSampler:
+    """Samples the Python stacks of every thread from a background thread.
+
+    Unlike cProfile, which only sees the thread that enabled it, this also
+    covers the CPU pool and the Vision workers, where most of a request's
+    time goes. Stacks are counted in collapsed form (``thread;outer;...;leaf``),
+    which flame graph tools read directly.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def sample(self) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Keeps the newest ``max_profiles`` profiles as JSON files in a
+    directory, dropping the oldest as new ones arrive. Workers on one
+    host can share the directory."""
+
+    def __init__(self, directory: str, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _paths(self) -> list[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # Names start with a nanosecond timestamp, so they sort by age.
+        return [os.path.join(self.directory, name) for name in sorted(names) if name.endswith(".json")]
+
+    def save(self, profile: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.time_ns()}-{profile['id']}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(profile, f)
+        os.replace(tmp, path)
+        for old in self._paths()[:-self.max_profiles or None]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+    def list(self) -> list[dict]:
+        """Summaries of the stored profiles, newest first."""
+        summaries = []
+        for path in reversed(self._paths()):
+            try:
+                with open(path) as f:
+                    profile = json.load(f)
+                size = os.path.getsize(path)
+            except (OSError, ValueError):
+                continue
+            summary = {key: value for key, value in profile.items() if key not in ("stacks", "memory")}
+            summaries.append({**summary, "size_bytes": size})
+        return summaries
+
+    def get(self, profile_id: str) -> dict | None:
+        for path in self._paths():
+            if path.endswith(f"-{profile_id}.json"):
+                try:
+                    with open(path) as f:
+                        return json.load(f)
+                except (OSError, ValueError):
+                    return None
+        return None
+
+
+class RequestProfiler:
+    """Decides which requests to profile and records their profiles.
+
+    A request is profiled when it carries the debug header with the
+    configured token, or at random with probability ``sample_rate``. One
+    request is profiled at a time; others that would be are let through
+    unprofiled, so the overhead stays bounded under load.
+    """
+
+    def __init__(
+        self, store: ProfileStore, sample_rate: float, token: str, header: str, interval: float,
+        trace_memory: bool, top_allocations: int = 25,
+    ):
+        self.store = store
+        self.sample_rate = sample_rate
+        self.token = token
+        self.header = header
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.top_allocations = top_allocations
+        self._busy = threading.Lock()
+        self._started_tracing = False
+        self._stats = {"profiled": 0, "skipped_busy": 0}
+
+    def authorized(self, request: Request) -> bool:
+        """Whether the request carries the debug token."""
+        value = request.headers.get(self.header)
+        # Compared as bytes: compare_digest rejects non-ASCII str.
+        return bool(self.token) and value is not None and hmac.compare_digest(value.encode(), self.token.encode())
+
+    def reason(self, request: Request) -> str | None:
+        path = request.url.path
+        if path.startswith("/admin"):
+            return None
+        if self.authorized(request):
+            return "header"
+        if self.sample_rate > 0 and not path.startswith(UNSAMPLED_PREFIXES) and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    @contextmanager
+    def profile(self, request: Request, reason: str) -> Iterator[dict | None]:
+        """Profiles the block. Yields the profile to fill in (``status``),
+        or None when another profile is already running. A profile that
+        was yielded must be passed to ``finish`` once the block is done."""
+        if not self._busy.acquire(blocking=False):
+            self._stats["skipped_busy"] += 1
+            yield None
+            return
+        self._started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        try:
+            if self._started_tracing:
+                tracemalloc.start()
+            elif self.trace_memory:
+                tracemalloc.reset_peak()
+            sampler = StackSampler(self.interval)
+            profile = {
+                "id": uuid.uuid4().hex[:12],
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "reason": reason,
+                "method": request.method,
+                "path": request.url.path,
+                "status": None,
+            }
+            start = time.perf_counter()
+            sampler.start()
+            try:
+                yield profile
+            finally:
+                sampler.stop()
+                profile["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                profile["samples"] = sampler.samples
+                profile["interval_ms"] = self.interval * 1000
+                profile["stacks"] = sampler.collapsed()
+        except BaseException:
+            self._end()
+            raise
+
+    def finish(self, profile: dict) -> None:
+        """Adds the memory statistics to a profile, ends it and saves it.
+        Meant for a thread: the tracemalloc snapshot and its statistics are
+        too slow to run on the event loop."""
+        try:
+            if self.trace_memory:
+                profile["memory"] = self._memory()
+            self._stats["profiled"] += 1
+        finally:
+            self._end()
+        self.store.save(profile)
+
+    def _end(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._busy.release()
+
+    def _memory(self) -> dict:
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        top = snapshot.statistics("lineno")[:self.top_allocations]
+        return {
+            "peak_kb": round(peak / 1024, 1),
+            # Allocations made during the request and still held at its end.
+            "retained": [
+                {
+                    "where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_kb": round(stat.size / 1024, 1),
+                    "count": stat.count,
+                }
+                for stat in top
+            ],
+        }
+
+    def stats(self) -> dict:
+        return {**self._stats, "sample_rate": self.sample_rate, "header_enabled": bool(self.token)}
+
+
+profiler = RequestProfiler(
+    ProfileStore(settings.profiling_dir, settings.profiling_max_profiles),
+    sample_rate=settings.profiling_sample_rate,
+    token=settings.profiling_token,
+    header=settings.profiling_header,
+    interval=settings.profiling_interval_ms / 1000,
+    trace_memory=settings.profiling_tracemalloc,
+)
@@ -1,6 +1,252 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.middleware import SlowAPIMiddleware
+from typing import NamedTuple
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+import structlog
+from fastapi import Request, UploadFile
 from app.config import settings
+from app.utils.exceptions import RateLimitError
 
-limiter = Limiter(key_func=get_remote_address, default_limits=[settings.rate_limit])
\ No newline at end of file
+logger = structlog.get_logger(__name__)
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(rate: str) -> tuple[float, float]:
+    """``"10/minute"`` -> ``(capacity, tokens per second)``."""
+    amount, period = rate.replace(" per ", "/").split("/")
+    capacity = float(amount)
+    return capacity, capacity / _PERIODS[period.strip().rstrip("s")]
+
+
+def _take(
+    tokens: float | None, updated_at: float, now: float, cost: float, capacity: float, rate: float
+) -> tuple[bool, float, float]:
+    """One token bucket step. Returns (allowed, tokens left, retry after).
+
+    A request costing more than the whole bucket is let through once the
+    bucket is full and leaves it in debt, so large batches are slowed down
+    instead of being rejected forever.
+    """
+    if tokens is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+    needed = min(cost, capacity)
+    if tokens >= needed:
+        return True, tokens - cost, 0.0
+    return False, tokens, (needed - tokens) / rate
+
+
+def _full_at(tokens: float, now: float, capacity: float, rate: float) -> float:
+    """When a bucket left with ``tokens`` at ``now`` is full again. From
+    then on it is no different from a missing one and can be dropped."""
+    return now + (capacity - tokens) / rate
+
+
+class MemoryStore:
+    """Buckets of a single process."""
+
+    # Refilled buckets are dropped every N takes rather than on each one.
+    PRUNE_EVERY = 1024
+    blocking = False
+
+    def __init__(self):
+        # key -> (tokens, updated_at, full_at)
+        self._buckets: dict[str, tuple[float, float, float]] = {}
+        self._takes = 0
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, capacity: float, rate: float) -> tuple[bool, float, float]:
+        now = time.time()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (None, now, now))
+            allowed, tokens, retry_after = _take(tokens, updated_at, now, cost, capacity, rate)
+            self._buckets[key] = (tokens, now, _full_at(tokens, now, capacity, rate))
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                for full in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+                    del self._buckets[full]
+        return allowed, tokens, retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteStore:
+    """Buckets in a SQLite file shared by every worker on the host. Each
+    step runs in a write transaction, so concurrent workers never both
+    spend the same tokens. When the file cannot be used (e.g. it stays
+    locked), the worker falls back to its own buckets instead of failing
+    the request. Like the Redis keys, rows are dropped once their bucket
+    has refilled."""
+
+    PRUNE_EVERY = MemoryStore.PRUNE_EVERY
+    blocking = True
+
+    def __init__(self, db_path: str):
+        self._db = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)")
+        self._takes = 0
+        self._lock = threading.Lock()
+        self._fallback = MemoryStore()
+
+    def take(self, key: str, cost: float, capacity: float, rate: float) -> tuple[bool, float, float]:
+        try:
+            with self._lock:
+                return self._take(key, cost, capacity, rate)
+        except sqlite3.Error as e:
+            logger.warning("rate_limit_store_failed", error=str(e))
+            return self._fallback.take(key, cost, capacity, rate)
+
+    def _take(self, key: str, cost: float, capacity: float, rate: float) -> tuple[bool, float, float]:
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = self._db.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row if row is not None else (None, now)
+            allowed, tokens, retry_after = _take(tokens, updated_at, now, cost, capacity, rate)
+            self._db.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, _full_at(tokens, now, capacity, rate)),
+            )
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                self._db.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+            self._db.execute("COMMIT")
+        except BaseException:
+            if self._db.in_transaction:
+                self._db.execute("ROLLBACK")
+            raise
+        return allowed, tokens, retry_after
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM buckets")
+        self._fallback.clear()
+
+
+# Same step as _take, run atomically inside Redis.
+_REDIS_TAKE = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local now, cost, capacity, rate = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = capacity
+if bucket[1] then
+  tokens = math.min(capacity, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+end
+local needed = math.min(cost, capacity)
+local allowed, retry_after = 0, 0
+if tokens >= needed then
+  allowed, tokens = 1, tokens - cost
+else
+  retry_after = (needed - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+
+class RedisStore:
+    """Buckets in Redis (or a compatible server), shared across hosts."""
+
+    PREFIX = "ocr:ratelimit:"
+    blocking = True
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the redis package is not installed") from e
+        self._redis = redis.Redis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_TAKE)
+
+    def take(self, key: str, cost: float, capacity: float, rate: float) -> tuple[bool, float, float]:
+        allowed, tokens, retry_after = self._script(keys=[self.PREFIX + key], args=[time.time(), cost, capacity, rate])
+        return bool(allowed), float(tokens), float(retry_after)
+
+    def clear(self) -> None:
+        for key in self._redis.scan_iter(self.PREFIX + "*"):
+            self._redis.delete(key)
+
+
+class Quota(NamedTuple):
+    allowed: bool
+    limit: float
+    remaining: float
+    retry_after: float
+    reset: float
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(int(self.limit)),
+            "X-RateLimit-Remaining": str(max(0, math.floor(self.remaining))),
+            "X-RateLimit-Reset": str(math.ceil(self.reset)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class QuotaLimiter:
+    """Per-client token buckets charged by the cost of each request: one
+    token per image plus one per ``mb_per_token`` MB uploaded."""
+
+    def __init__(self, store, limits: dict[str, str], mb_per_token: float):
+        self.store = store
+        self.limits = {name: parse_rate(rate) for name, rate in limits.items()}
+        self.bytes_per_token = mb_per_token * 1024 * 1024
+        self.enabled = True
+
+    def cost(self, images: list[UploadFile]) -> int:
+        return sum(1 + int((image.size or 0) // self.bytes_per_token) for image in images)
+
+    async def check(self, request: Request, name: str, images: list[UploadFile]) -> Quota | None:
+        """Charges the client's ``name`` bucket, raising a 429 when it is
+        empty. The quota headers are added to the response by middleware.
+        Shared stores are called from a thread, off the event loop."""
+        if not self.enabled:
+            return None
+        capacity, rate = self.limits[name]
+        client = request.client.host if request.client else "unknown"
+        args = (f"{name}:{client}", self.cost(images), capacity, rate)
+        if self.store.blocking:
+            allowed, tokens, retry_after = await asyncio.to_thread(self.store.take, *args)
+        else:
+            allowed, tokens, retry_after = self.store.take(*args)
+        quota = Quota(allowed, capacity, tokens, retry_after, (capacity - tokens) / rate)
+        request.state.quota = quota
+        if not allowed:
+            logger.info("rate_limited", client=client, bucket=name, retry_after=round(retry_after, 2))
+            raise RateLimitError("Rate limit exceeded, please retry later.", headers=quota.headers())
+        return quota
+
+    def reset(self) -> None:
+        self.store.clear()
+
+
+def _store():
+    if settings.rate_limit_redis_url:
+        return RedisStore(settings.rate_limit_redis_url)
+    if settings.rate_limit_db_path:
+        try:
+            return SQLiteStore(settings.rate_limit_db_path)
+        except sqlite3.Error as e:
+            logger.warning("rate_limit_store_unavailable", path=settings.rate_limit_db_path, error=str(e))
+    return MemoryStore()
+
+
+limiter = QuotaLimiter(
+    _store(),
+    {"extract": settings.rate_limit, "batch": settings.batch_rate_limit, "jobs": settings.jobs_rate_limit},
+    settings.rate_limit_mb_per_token,
+)
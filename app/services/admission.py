@@ -0,0 +1,172 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+import asyncio
+import math
+import threading
+import time
+import structlog
+from app.utils import deadline
+from app.utils.exceptions import ServiceUnavailableError
+
+logger = structlog.get_logger(__name__)
+
+
+class Ticket:
+    """Handed to an admitted request. Set ``backend_seconds`` to the time
+    it spent waiting on the OCR backend and ``overloaded`` when the backend
+    shed it; both steer the concurrency limit."""
+
+    def __init__(self):
+        self.backend_seconds: float | None = None
+        self.overloaded = False
+
+
+class AdmissionController:
+    """Limits concurrent OCR requests and queues the rest fairly.
+
+    The limit follows AIMD: it grows by ``1 / limit`` per request whose
+    backend latency stays within ``tolerance`` times the best recent
+    latency, and shrinks by 10% when latency rises past that or the
+    backend is overloaded. Waiting requests are queued per client and
+    served round-robin, so one client's burst cannot starve the others.
+    Requests that cannot start before their deadline are turned away with
+    a 503 instead of taking a slot they cannot use.
+    """
+
+    BACKOFF = 0.9
+
+    def __init__(
+        self, initial_limit: int, min_limit: int, max_limit: int, max_queue: int, tolerance: float,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.tolerance = tolerance
+        self._active = 0
+        self._queued = 0
+        self._queues: OrderedDict[str, deque[Future]] = OrderedDict()
+        self._latencies: deque[float] = deque(maxlen=100)
+        self._service_seconds = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "rejected_queue_full": 0, "rejected_deadline": 0, "expired_in_queue": 0}
+
+    @asynccontextmanager
+    async def admit(self, client: str) -> AsyncIterator[Ticket]:
+        if not self.enabled:
+            yield Ticket()
+            return
+        await self._acquire(client)
+        ticket = Ticket()
+        started = time.perf_counter()
+        try:
+            yield ticket
+        except Exception as e:
+            if deadline.expired():
+                # A deadline the client chose is no sign of overload.
+                raise ServiceUnavailableError("Request deadline exceeded.", retry_after=self._retry_after()) from e
+            if isinstance(e, ServiceUnavailableError):
+                ticket.overloaded = True
+            raise
+        finally:
+            self._release(time.perf_counter() - started, ticket)
+
+    def _estimate_wait(self, ahead: int) -> float:
+        # Each slot works through one request per average service time.
+        return (ahead // max(1, int(self.limit)) + 1) * self._service_seconds
+
+    def _retry_after(self) -> int:
+        with self._lock:
+            return max(1, math.ceil(self._estimate_wait(self._queued)))
+
+    async def _acquire(self, client: str) -> None:
+        left = deadline.remaining()
+        with self._lock:
+            if self._active < int(self.limit) and not self._queued:
+                if left is not None and left < self._service_seconds:
+                    self._stats["rejected_deadline"] += 1
+                    raise ServiceUnavailableError("Request cannot finish before its deadline.", retry_after=1)
+                self._active += 1
+                self._stats["admitted"] += 1
+                return
+            wait = self._estimate_wait(self._queued)
+            retry_after = max(1, math.ceil(wait))
+            if self._queued >= self.max_queue:
+                self._stats["rejected_queue_full"] += 1
+                logger.warning("admission_queue_full", queued=self._queued, limit=int(self.limit))
+                raise ServiceUnavailableError("Server is overloaded, please retry later.", retry_after=retry_after)
+            if left is not None and left < wait + self._service_seconds:
+                self._stats["rejected_deadline"] += 1
+                raise ServiceUnavailableError("Request cannot finish before its deadline.", retry_after=retry_after)
+            waiter = Future()
+            self._queues.setdefault(client, deque()).append(waiter)
+            self._queued += 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)), timeout=left)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                granted = waiter.done()
+                if not granted:
+                    self._queues[client].remove(waiter)
+                    if not self._queues[client]:
+                        del self._queues[client]
+                    self._queued -= 1
+                    waiter.cancel()
+            if granted:
+                # The slot was handed over just as the wait ended.
+                self._release(0.0, None)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            with self._lock:
+                self._stats["expired_in_queue"] += 1
+            raise ServiceUnavailableError("Request deadline expired while queued.", retry_after=self._retry_after())
+        with self._lock:
+            self._stats["admitted"] += 1
+
+    def _release(self, seconds: float, ticket: Ticket | None) -> None:
+        with self._lock:
+            if ticket is not None:
+                self._service_seconds = seconds if not self._service_seconds else (
+                    0.9 * self._service_seconds + 0.1 * seconds
+                )
+                self._adjust(ticket)
+            self._active -= 1
+            # Hand freed slots to waiting clients in turn.
+            while self._queued and self._active < int(self.limit):
+                client, queue = next(iter(self._queues.items()))
+                waiter = queue.popleft()
+                self._queued -= 1
+                if queue:
+                    self._queues.move_to_end(client)
+                else:
+                    del self._queues[client]
+                self._active += 1
+                waiter.set_result(None)
+
+    def _adjust(self, ticket: Ticket) -> None:
+        if ticket.overloaded:
+            self.limit = max(self.min_limit, self.limit * self.BACKOFF)
+            return
+        if ticket.backend_seconds is None:
+            return
+        self._latencies.append(ticket.backend_seconds)
+        if ticket.backend_seconds > min(self._latencies) * self.tolerance:
+            self.limit = max(self.min_limit, self.limit * self.BACKOFF)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "limit": round(self.limit, 2),
+                "active": self._active,
+                "queued": self._queued,
+                "clients_waiting": len(self._queues),
+                "avg_service_ms": round(self._service_seconds * 1000, 1),
+            }
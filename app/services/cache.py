@@ -0,0 +1,256 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class ResultCache:
+    """Digest-keyed OCR result cache bounded by bytes.
+
+    Results live in an in-memory LRU tier in front of an optional SQLite
+    tier. The SQLite file is shared by every worker on the host and
+    survives restarts. All SQLite work runs on one background thread, so
+    neither disk reads nor the other workers' write locks stall the event
+    loop; writes are queued and do not wait for the disk at all.
+    """
+
+    # The disk budget is enforced every N writes rather than on each one.
+    TRIM_EVERY = 64
+
+    def __init__(self, memory_max_bytes: int, disk_max_bytes: int, ttl_seconds: int, db_path: str = ""):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory: OrderedDict[str, tuple[float, int, Any]] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self._writes = 0
+        # Disk hits whose accessed_at is not written yet; only touched on the I/O thread.
+        self._touched: dict[str, float] = {}
+        self._db: sqlite3.Connection | None = None
+        self._io: ThreadPoolExecutor | None = None
+        if db_path:
+            try:
+                self._db = self._connect(db_path)
+                self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-io")
+            except sqlite3.Error as e:
+                logger.warning("cache_disk_tier_unavailable", path=db_path, error=str(e))
+
+    @staticmethod
+    def _connect(db_path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(db_path, timeout=5, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+            # Total size of the rows, kept current by triggers so trimming
+            # never has to sum the table.
+            db.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            if db.execute("SELECT 1 FROM cache_meta WHERE name = 'bytes'").fetchone() is None:
+                db.execute("INSERT INTO cache_meta (name, value) SELECT 'bytes', COALESCE(SUM(size), 0) FROM results")
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS results_bytes_insert AFTER INSERT ON results BEGIN "
+                "UPDATE cache_meta SET value = value + new.size WHERE name = 'bytes'; END"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS results_bytes_update AFTER UPDATE OF size ON results BEGIN "
+                "UPDATE cache_meta SET value = value + new.size - old.size WHERE name = 'bytes'; END"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS results_bytes_delete AFTER DELETE ON results BEGIN "
+                "UPDATE cache_meta SET value = value - old.size WHERE name = 'bytes'; END"
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        return db
+
+    def _expires_at(self, now: float) -> float:
+        return now + self.ttl_seconds if self.ttl_seconds > 0 else float("inf")
+
+    def get(self, key: str) -> Any | None:
+        """Looks ``key`` up in both tiers, blocking on the disk tier. On the
+        event loop use ``get_async``."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        if self._io is None:
+            return self._get_disk(key, now)
+        return self._io.submit(self._get_disk, key, now).result()
+
+    async def get_async(self, key: str) -> Any | None:
+        """Like ``get``, but waits for the disk tier without blocking the loop."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        if self._io is None:
+            return self._get_disk(key, now)
+        return await asyncio.wrap_future(self._io.submit(self._get_disk, key, now))
+
+    def set(self, key: str, value: Any) -> None:
+        """Stores ``value`` in memory at once and queues the disk write."""
+        payload = json.dumps(value)
+        now = time.time()
+        expires_at = self._expires_at(now)
+        with self._lock:
+            self._remember(key, value, len(payload), expires_at)
+        if self._io is not None:
+            self._io.submit(self._write_disk, key, payload, expires_at, now)
+
+    def flush(self) -> None:
+        """Waits until the queued disk writes are done."""
+        if self._io is not None:
+            self._io.submit(lambda: None).result()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for name in self._stats:
+                self._stats[name] = 0
+        if self._io is not None:
+            self._io.submit(self._clear_disk).result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "hits": hits,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+
+    def _get_memory(self, key: str, now: float) -> Any | None:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return value
+            self._drop(key)
+            self._stats["expired"] += 1
+            return None
+
+    def _get_disk(self, key: str, now: float) -> Any | None:
+        if self._db is not None:
+            try:
+                row = self._db.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    with self._lock:
+                        self._remember(key, value, len(row[0]), row[1])
+                        self._stats["disk_hits"] += 1
+                    # Recency is written in batches, not as a write per hit.
+                    self._touched[key] = now
+                    if len(self._touched) >= self.TRIM_EVERY:
+                        self._flush_touched()
+                    return value
+                if row is not None:
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    with self._lock:
+                        self._stats["expired"] += 1
+            except sqlite3.Error as e:
+                logger.warning("cache_disk_read_failed", error=str(e))
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def _write_disk(self, key: str, payload: str, expires_at: float, now: float) -> None:
+        try:
+            self._db.execute(
+                "INSERT INTO results (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (key, payload, len(payload), expires_at, now),
+            )
+            self._writes += 1
+            if self._writes % self.TRIM_EVERY == 0:
+                self._trim_disk(now)
+        except sqlite3.Error as e:
+            logger.warning("cache_disk_write_failed", error=str(e))
+
+    def _clear_disk(self) -> None:
+        self._touched.clear()
+        self._db.execute("DELETE FROM results")
+
+    def _flush_touched(self) -> None:
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany(
+                "UPDATE results SET accessed_at = ? WHERE key = ?", [(at, key) for key, at in touched.items()]
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            if self._db.in_transaction:
+                self._db.execute("ROLLBACK")
+            raise
+
+    def _remember(self, key: str, value: Any, size: int, expires_at: float) -> None:
+        if size > self.memory_max_bytes:
+            return
+        self._drop(key)
+        self._memory[key] = (expires_at, size, value)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            oldest = next(iter(self._memory))
+            self._drop(oldest)
+            self._stats["evictions"] += 1
+
+    def _drop(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[1]
+
+    def _trim_disk(self, now: float) -> None:
+        self._flush_touched()
+        self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now,))
+        excess = self._db.execute("SELECT value FROM cache_meta WHERE name = 'bytes'").fetchone()[0]
+        excess -= self.disk_max_bytes
+        if excess <= 0:
+            return
+        # Walk the least recently used rows through the index only as far
+        # as needed to free the excess.
+        victims = []
+        cursor = self._db.execute("SELECT key, size FROM results ORDER BY accessed_at")
+        for key, size in cursor:
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        cursor.close()
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany("DELETE FROM results WHERE key = ?", victims)
+            self._db.execute("COMMIT")
+        except BaseException:
+            if self._db.in_transaction:
+                self._db.execute("ROLLBACK")
+            raise
@@ -0,0 +1,63 @@
+from array import array
+
+# Word columns of a layout, in output order.
+WORD_COLUMNS = ("text", "confidence", "page", "block", "paragraph", "x0", "y0", "x1", "y1")
+
+
+def raw(message):
+    """The protobuf message under a proto-plus wrapper. Walking it directly
+    is many times faster than going through the wrappers, which build a
+    new Python object on every attribute access."""
+    pb = getattr(type(message), "pb", None)
+    return pb(message) if pb is not None else message
+
+
+def decode(response) -> tuple[str, float, dict]:
+    """Reads a Vision ``AnnotateImageResponse`` (wrapped or raw) in one pass.
+
+    Returns the text, the mean symbol confidence and the word layout:
+    page sizes plus one column per word attribute, all of equal length.
+    Block and paragraph numbers run across the whole response, boxes are
+    the pixel extents of each word's bounding polygon.
+    """
+    annotation = raw(response).full_text_annotation
+    symbol_confidences = array("d")
+    texts: list[str] = []
+    confidences = array("f")
+    pages, blocks, paragraphs = array("I"), array("I"), array("I")
+    x0, y0, x1, y1 = array("i"), array("i"), array("i"), array("i")
+    sizes = []
+    block_number = paragraph_number = 0
+    for page_number, page in enumerate(annotation.pages):
+        sizes.append({"width": page.width, "height": page.height})
+        for block in page.blocks:
+            for paragraph in block.paragraphs:
+                for word in paragraph.words:
+                    chars = []
+                    for symbol in word.symbols:
+                        if symbol.confidence:
+                            symbol_confidences.append(symbol.confidence)
+                        chars.append(symbol.text)
+                    texts.append("".join(chars))
+                    confidences.append(word.confidence)
+                    pages.append(page_number)
+                    blocks.append(block_number)
+                    paragraphs.append(paragraph_number)
+                    points = [(vertex.x, vertex.y) for vertex in word.bounding_box.vertices] or [(0, 0)]
+                    xs, ys = zip(*points)
+                    x0.append(min(xs))
+                    y0.append(min(ys))
+                    x1.append(max(xs))
+                    y1.append(max(ys))
+                paragraph_number += 1
+            block_number += 1
+
+    confidence = sum(symbol_confidences) / len(symbol_confidences) if symbol_confidences else 0.0
+    layout = {
+        "pages": sizes,
+        "words": dict(zip(WORD_COLUMNS, (
+            texts, [round(c, 3) for c in confidences], pages.tolist(), blocks.tolist(), paragraphs.tolist(),
+            x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist(),
+        ))),
+    }
+    return annotation.text.strip(), round(confidence, 2), layout
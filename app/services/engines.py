@@ -0,0 +1,165 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+import structlog
+from app.utils import deadline
+
+logger = structlog.get_logger(__name__)
+
+# (text, confidence), plus the word layout for engines that report one.
+Extracted = tuple[str, float] | tuple[str, float, dict]
+Result = Extracted | Exception
+
+
+class OCREngine(ABC):
+    """Turns images into ``(text, confidence)`` pairs, or
+    ``(text, confidence, layout)`` for engines that report word boxes.
+
+    ``extract`` takes a batch and returns one result per image, in order.
+    Failures of single images are returned in their slot; failures of the
+    whole call are raised, so the caller can retry them. Engines are called
+    from worker threads and may block.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def extract(self, images: list[bytes]) -> list[Result]:
+        ...
+
+    def extract_one(self, image: bytes) -> Extracted:
+        result = self.extract([image])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"engine": self.name}
+
+
+class StubEngine(OCREngine):
+    """Deterministic engine for offline runs: the text is derived from the
+    image digest, so repeated runs give identical results."""
+
+    name = "stub"
+
+    def __init__(self, latency_ms: int = 0, confidence: float = 0.99):
+        self.latency_ms = latency_ms
+        self.confidence = confidence
+
+    def extract(self, images: list[bytes]) -> list[Result]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [(f"STUB {hashlib.sha256(image).hexdigest()[:12]}", self.confidence) for image in images]
+
+
+def parse_tsv(output: str) -> tuple[str, float]:
+    """Rebuilds text and mean word confidence from ``tesseract ... tsv``."""
+    lines: dict[tuple[str, ...], list[str]] = {}
+    confidences = []
+    for row in output.splitlines()[1:]:
+        columns = row.split("\t")
+        if len(columns) < 12 or columns[0] != "5":
+            continue
+        word = columns[11].strip()
+        confidence = float(columns[10])
+        if not word or confidence < 0:
+            continue
+        # page, block, paragraph and line numbers identify the line.
+        lines.setdefault(tuple(columns[1:5]), []).append(word)
+        confidences.append(confidence / 100)
+    text = "\n".join(" ".join(words) for words in lines.values())
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, round(confidence, 2)
+
+
+class TesseractEngine(OCREngine):
+    """Runs the Tesseract CLI on the host, one process per image, up to
+    ``workers`` at a time."""
+
+    name = "tesseract"
+
+    def __init__(self, cmd: str, lang: str, workers: int, timeout: float):
+        path = shutil.which(cmd)
+        if path is None:
+            raise RuntimeError(f"Tesseract not found: {cmd}")
+        self.cmd = path
+        self.lang = lang
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="tesseract")
+
+    def _run(self, image: bytes, timeout: float) -> Result:
+        try:
+            completed = subprocess.run(
+                [self.cmd, "stdin", "stdout", "-l", self.lang, "tsv"],
+                input=image, capture_output=True, timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            return TimeoutError(f"Tesseract timed out after {timeout:.1f}s")
+        if completed.returncode != 0:
+            return ValueError(completed.stderr.decode(errors="replace").strip() or "Tesseract failed")
+        return parse_tsv(completed.stdout.decode(errors="replace"))
+
+    def extract(self, images: list[bytes]) -> list[Result]:
+        left = deadline.remaining()
+        timeout = self.timeout if left is None else min(self.timeout, left)
+        return list(self._executor.map(self._run, images, [timeout] * len(images)))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+class RoutingEngine(OCREngine):
+    """Tries the ``local`` engine first and sends only the images it fails
+    on, or reads with less than ``min_confidence``, to ``fallback``."""
+
+    name = "routing"
+
+    def __init__(self, local: OCREngine, fallback: OCREngine, min_confidence: float):
+        self.local = local
+        self.fallback = fallback
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._counts = {"local": 0, "fallback": 0}
+
+    def _accepted(self, result: Result) -> bool:
+        return not isinstance(result, Exception) and result[1] >= self.min_confidence
+
+    def extract(self, images: list[bytes]) -> list[Result]:
+        results = self.local.extract(images)
+        retry = [i for i, result in enumerate(results) if not self._accepted(result)]
+        with self._lock:
+            self._counts["local"] += len(images) - len(retry)
+            self._counts["fallback"] += len(retry)
+        if retry:
+            logger.info("ocr_engine_fallback", images=len(retry), engine=self.fallback.name)
+            for i, result in zip(retry, self.fallback.extract([images[i] for i in retry])):
+                results[i] = result
+        return results
+
+    def extract_one(self, image: bytes) -> Extracted:
+        try:
+            result = self.local.extract_one(image)
+        except Exception as e:
+            result = e
+        with self._lock:
+            self._counts["local" if self._accepted(result) else "fallback"] += 1
+        if self._accepted(result):
+            return result
+        return self.fallback.extract_one(image)
+
+    def close(self) -> None:
+        self.local.close()
+        self.fallback.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"engine": self.name, "served_locally": self._counts["local"], "fell_back": self._counts["fallback"]}
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from typing import AsyncIterator, Callable
+import asyncio
+import time
+import uuid
+import structlog
+from app.utils.exceptions import ServiceUnavailableError
+
+logger = structlog.get_logger(__name__)
+
+Processor = Callable[[list[tuple], float], AsyncIterator[tuple[int, dict]]]
+
+
+class JobManager:
+    """In-process OCR job queue.
+
+    Submitted jobs wait in a bounded queue drained by a fixed pool of
+    worker tasks. The queue is bounded both by job count and by the bytes
+    of image data held by queued and running jobs, since each job keeps
+    its uploads in memory until it is done. When either is exceeded,
+    submission fails fast with a 503 instead of holding the client's
+    connection open. A job larger than ``max_pending_bytes`` is only
+    accepted when nothing else is pending.
+    """
+
+    def __init__(
+        self, process: Processor, workers: int, max_queue: int, max_retained: int, max_pending_bytes: int = 0,
+    ):
+        self.process = process
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_retained = max_retained
+        self.max_pending_bytes = max_pending_bytes
+        self._pending_bytes = 0
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._pending_bytes = 0
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def check(self, size: int = 0) -> None:
+        """Raises a 503 when a job holding ``size`` bytes would be refused,
+        so callers can turn it away before reading its uploads."""
+        if self._queue is None:
+            raise ServiceUnavailableError("Job queue is not running.", retry_after=5)
+        if self._queue.full() or (
+            self.max_pending_bytes and self._pending_bytes and self._pending_bytes + size > self.max_pending_bytes
+        ):
+            raise ServiceUnavailableError("Job queue is full, please retry later.", retry_after=5)
+
+    def submit(self, results: list[dict | None], items: list[tuple], size: int = 0) -> dict:
+        """Queues ``items`` for processing; ``size`` is the bytes of image
+        data they hold."""
+        self.check(size)
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "created_at": time.time(),
+            "total": len(results),
+            "completed": len(results) - len(items),
+            "results": results,
+        }
+        try:
+            self._queue.put_nowait((job, items, size))
+        except asyncio.QueueFull:
+            raise ServiceUnavailableError("Job queue is full, please retry later.", retry_after=5)
+        self._pending_bytes += size
+        self._jobs[job["job_id"]] = job
+        self._evict()
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "pending_mb": round(self._pending_bytes / (1024 * 1024), 1),
+            "workers": self.workers,
+            "retained": len(self._jobs),
+        }
+
+    def _evict(self) -> None:
+        # Drop the oldest finished jobs once more than max_retained are kept.
+        excess = len(self._jobs) - self.max_retained
+        for job_id in [j for j, job in self._jobs.items() if job["status"] == "completed"][:max(0, excess)]:
+            del self._jobs[job_id]
+
+    async def _work(self) -> None:
+        while True:
+            job, items, size = await self._queue.get()
+            job["status"] = "running"
+            start_time = time.perf_counter()
+            try:
+                async for index, data in self.process(items, start_time):
+                    job["results"][index] = data
+                    job["completed"] += 1
+            except Exception as e:
+                logger.error("job_failed", job_id=job["job_id"], error=str(e))
+                for index, result in enumerate(job["results"]):
+                    if result is None:
+                        job["results"][index] = {"error": f"OCR processing failed: {str(e)}"}
+                job["completed"] = job["total"]
+            job["status"] = "completed"
+            job["processing_time_ms"] = int((time.perf_counter() - start_time) * 1000)
+            self._pending_bytes -= size
+            self._queue.task_done()
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+import threading
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Metric tree over Hamming distance. A lookup within distance ``d``
+    only descends into children whose edge label is within ``d`` of the
+    query's distance to the node, so most of the tree is never visited."""
+
+    def __init__(self):
+        self._root: tuple[int, str, dict] | None = None
+
+    def add(self, key: int, value: str) -> None:
+        if self._root is None:
+            self._root = (key, value, {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (key, value, {})
+                return
+            node = child
+
+    def search(self, key: int, max_distance: int) -> list[tuple[int, str]]:
+        matches = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_key, value, children = stack.pop()
+            distance = hamming(key, node_key)
+            if distance <= max_distance:
+                matches.append((distance, value))
+            for edge in range(distance - max_distance, distance + max_distance + 1):
+                child = children.get(edge)
+                if child is not None:
+                    stack.append(child)
+        return matches
+
+
+class NearDuplicateIndex:
+    """Maps perceptual hashes to the digest of an already OCR'd image.
+
+    BK-trees do not support deletion, so once the index grows past
+    ``max_entries`` it is rebuilt from the most recently added hashes.
+    """
+
+    def __init__(self, max_distance: int, max_entries: int):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, str] = OrderedDict()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = 0
+
+    def add(self, phash: int, digest: str) -> None:
+        with self._lock:
+            if phash in self._entries:
+                self._entries.move_to_end(phash)
+                return
+            self._entries[phash] = digest
+            self._tree.add(phash, digest)
+            if len(self._entries) > self.max_entries * 1.25:
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._tree = BKTree()
+                for key, value in self._entries.items():
+                    self._tree.add(key, value)
+
+    def lookup(self, phash: int) -> str | None:
+        with self._lock:
+            self._lookups += 1
+            matches = self._tree.search(phash, self.max_distance)
+            if not matches:
+                return None
+            self._hits += 1
+            return min(matches)[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tree = BKTree()
+            self._lookups = self._hits = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_ratio": round(self._hits / self._lookups, 4) if self._lookups else 0.0,
+            }
@@ -1,43 +1,612 @@
-
-from google.cloud import vision
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, NamedTuple, TypeVar
+import asyncio
+import contextvars
+import threading
+import time
 import structlog
 from app.config import settings
+from app.services.cache import ResultCache
+from app.services.decoding import decode, raw
+from app.services.engines import Extracted, OCREngine, Result, RoutingEngine, StubEngine, TesseractEngine
+from app.utils import deadline
+from app.utils.cpu_pool import cpu_pool
+from app.services.near_dup import NearDuplicateIndex
+from app.services.resilience import CircuitBreaker, ResilientBackend, RetryBudget
+from app.utils.imaging import blank_reason, dhash, grayscale_thumbnail, prepare_for_vision
+from app.utils.metrics import cache_lookups, timer
+
+if TYPE_CHECKING:
+    from google.cloud import vision
 
 logger = structlog.get_logger(__name__)
 
-@lru_cache(maxsize=settings.cache_size)
-def cached_extract(image_hash: str, content: bytes) -> tuple[str, float]:
-    return _extract_text(content)
+T = TypeVar("T")
+
+# google.cloud.vision pulls in grpc, protobuf and google-auth, so it is
+# only imported when a client is first needed (see `warm_up`).
+_client: "vision.ImageAnnotatorClient | None" = None
+_engine: OCREngine | None = None
+_executor: ThreadPoolExecutor | None = None
+_lock = threading.Lock()
+
+result_cache = ResultCache(
+    memory_max_bytes=settings.cache_memory_max_mb * 1024 * 1024,
+    disk_max_bytes=settings.cache_disk_max_mb * 1024 * 1024,
+    ttl_seconds=settings.cache_ttl_seconds,
+    db_path=settings.cache_db_path,
+)
+
+# Word layouts are many times larger than the text and only returned on
+# request, so they get a memory tier of their own instead of crowding
+# results out of `result_cache`. A layout request whose layout has been
+# evicted reads the image again.
+layout_cache = ResultCache(
+    memory_max_bytes=settings.layout_cache_max_mb * 1024 * 1024,
+    disk_max_bytes=0,
+    ttl_seconds=settings.cache_ttl_seconds,
+)
+
+near_duplicates = NearDuplicateIndex(settings.near_dup_max_distance, settings.near_dup_max_entries)
+
+
+@lru_cache(maxsize=None)
+def _transient_errors() -> tuple[type[BaseException], ...]:
+    from google.api_core import exceptions as api_exceptions
+    return (
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.DeadlineExceeded,
+        api_exceptions.InternalServerError,
+        api_exceptions.BadGateway,
+        api_exceptions.GatewayTimeout,
+        api_exceptions.TooManyRequests,
+        api_exceptions.ResourceExhausted,
+        api_exceptions.Aborted,
+        ConnectionError,
+        TimeoutError,
+    )
+
+
+def is_transient(exc: BaseException) -> bool:
+    return isinstance(exc, _transient_errors())
 
-@retry(
-    stop=stop_after_attempt(settings.vision_retry_attempts),
-    wait=wait_exponential(multiplier=1, min=1, max=10),
-    retry=retry_if_exception_type(Exception)
+
+backend = ResilientBackend(
+    "OCR backend",
+    is_transient,
+    attempts=settings.vision_retry_attempts,
+    base_delay=settings.vision_retry_base_ms / 1000,
+    max_delay=settings.vision_retry_max_ms / 1000,
+    budget=RetryBudget(settings.vision_retry_budget_ratio, settings.vision_retry_budget_reserve),
+    breaker=CircuitBreaker(settings.breaker_failure_threshold, settings.breaker_reset_seconds),
+    hedge=settings.vision_hedge_enabled,
+    hedge_min_samples=settings.vision_hedge_min_samples,
+    stage="vision_rpc",
 )
-def _extract_text(content: bytes) -> tuple[str, float]:
-    client = vision.ImageAnnotatorClient()
+
+# Single-flight table: concurrent requests for the same digest share one
+# extraction instead of each missing the cache and calling Vision.
+_inflight: dict[str, Future] = {}
+# Latest deadline among the requests waiting on each in-flight digest. The
+# shared call runs under it, so one caller's deadline cannot cut it short
+# for the others.
+_inflight_deadlines: dict[str, float | None] = {}
+_inflight_lock = threading.Lock()
+_counters = {"coalesced": 0, "skipped": 0}
+_tasks: set[asyncio.Task] = set()
+
+
+def get_client() -> "vision.ImageAnnotatorClient":
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from google.cloud import vision
+                _client = vision.ImageAnnotatorClient()
+    return _client
+
+
+class VisionEngine(OCREngine):
+    name = "vision"
+
+    def extract(self, images: list[bytes]) -> list[Result]:
+        return _extract_batch(images)
+
+    def extract_one(self, image: bytes) -> Extracted:
+        return _extract_text(image)
+
+
+def _tesseract() -> TesseractEngine:
+    return TesseractEngine(
+        settings.tesseract_cmd, settings.tesseract_lang, settings.tesseract_workers, settings.tesseract_timeout_seconds
+    )
+
+
+def build_engine(name: str) -> OCREngine:
+    if name == "vision":
+        return VisionEngine()
+    if name == "stub":
+        return StubEngine(settings.stub_latency_ms)
+    if name == "tesseract":
+        return _tesseract()
+    if name == "routing":
+        # Vision only sees what the local engine could not read confidently.
+        return RoutingEngine(_tesseract(), VisionEngine(), settings.routing_min_confidence)
+    raise ValueError(f"Unknown OCR engine: {name}")
+
+
+def get_engine() -> OCREngine:
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = build_engine(settings.ocr_engine)
+    return _engine
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.vision_max_concurrency,
+                    thread_name_prefix="vision",
+                )
+    return _executor
+
+
+def open_client() -> None:
+    get_executor()
+    # A misconfigured engine (e.g. Tesseract not installed) fails startup.
+    get_engine()
+
+
+def warm_up(timeout: float) -> None:
+    """Creates the Vision client and connects its channel, so the first
+    request pays for neither. Blocks for up to ``timeout`` seconds."""
+    if get_engine().name not in ("vision", "routing"):
+        return
+    try:
+        client = get_client()
+    except Exception as e:
+        # Credentials may only be available later (e.g. mounted after boot);
+        # the client is created lazily on the first request instead.
+        logger.warning("vision_client_init_failed", error=str(e))
+        return
+    import grpc
+    channel = getattr(client.transport, "grpc_channel", None)
+    if not isinstance(channel, grpc.Channel):
+        return
+    ready = grpc.channel_ready_future(channel)
+    try:
+        ready.result(timeout=timeout)
+    except grpc.FutureTimeoutError:
+        ready.cancel()
+        logger.warning("vision_channel_not_ready", timeout=timeout)
+
+
+def close_client() -> None:
+    global _client, _engine, _executor
+    with _lock:
+        executor, _executor = _executor, None
+        client, _client = _client, None
+        engine, _engine = _engine, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if engine is not None:
+        engine.close()
+    if client is not None:
+        client.transport.close()
+
+
+class BatchScheduler:
+    """Groups single-image requests into Vision batch RPCs.
+
+    A request waits at most ``max_wait_ms`` for others to join it; a batch
+    is sent early once ``max_batch_size`` requests are pending.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: int):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: list[tuple[bytes, Future, float]] = []
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self.batches = 0
+        self.batched_images = 0
+
+    def submit(self, content: bytes) -> Future:
+        future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name="vision-batcher", daemon=True)
+                self._thread.start()
+            self._pending.append((content, future, time.monotonic()))
+            self._cond.notify()
+        return future
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                # Callers that gave up (e.g. a losing hedge) are dropped here.
+                batch = [item for item in self._pending[:self.max_batch_size] if item[1].set_running_or_notify_cancel()]
+                del self._pending[:self.max_batch_size]
+                if not batch:
+                    continue
+                self.batches += 1
+                self.batched_images += len(batch)
+            get_executor().submit(_run_batch, [(content, future) for content, future, _ in batch])
+
+
+def _run_batch(batch: list[tuple[bytes, Future]]) -> None:
+    try:
+        results = get_engine().extract([content for content, _ in batch])
+    except Exception as e:
+        results = [e] * len(batch)
+    for (_, future), result in zip(batch, results):
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+
+_scheduler = (
+    BatchScheduler(settings.vision_batch_max_size, settings.vision_batch_window_ms)
+    if settings.vision_batch_window_ms > 0 else None
+)
+
+
+def _count(name: str) -> None:
+    with _inflight_lock:
+        _counters[name] += 1
+
+
+def _claim(image_hash: str) -> tuple[Future, bool]:
+    """Returns the shared future for a digest and whether the caller owns
+    it, i.e. must produce the result."""
+    until = deadline.current()
+    with _inflight_lock:
+        future = _inflight.get(image_hash)
+        if future is not None:
+            _counters["coalesced"] += 1
+            _inflight_deadlines[image_hash] = deadline.later(_inflight_deadlines.get(image_hash), until)
+            return future, False
+        future = Future()
+        _inflight[image_hash] = future
+        _inflight_deadlines[image_hash] = until
+    future.add_done_callback(lambda f: _release(image_hash, f))
+    return future, True
+
+
+def _release(image_hash: str, future: Future) -> None:
+    with _inflight_lock:
+        if _inflight.get(image_hash) is future:
+            del _inflight[image_hash]
+            _inflight_deadlines.pop(image_hash, None)
+
+
+def _shared_deadline(hashes: list[str]) -> float | None:
+    with _inflight_lock:
+        until = _inflight_deadlines.get(hashes[0])
+        for image_hash in hashes[1:]:
+            until = deadline.later(until, _inflight_deadlines.get(image_hash))
+    return until
+
+
+async def _call_shared(hashes: list[str], kind: str, attempt: Callable[[], Awaitable[T]]) -> T:
+    """Calls the backend for in-flight digests under the latest deadline of
+    the requests waiting on them. If that runs out after a request with a
+    later deadline has joined, the call is made again for it."""
+    while True:
+        until = _shared_deadline(hashes)
+        try:
+            with deadline.until(until):
+                return await backend.call(kind, attempt)
+        except Exception:
+            if until is None or time.monotonic() < until:
+                raise
+            latest = _shared_deadline(hashes)
+            if latest is not None and latest <= until:
+                raise
+
+
+class Prepared(NamedTuple):
+    skipped_reason: str | None
+    payload: bytes
+    phash: int | None
+
+
+def _settle(
+    future: Future, image_hash: str, result: Result,
+    bytes_saved: int = 0, skipped_reason: str | None = None, phash: int | None = None,
+) -> None:
+    if isinstance(result, Exception):
+        future.set_exception(result)
+        return
+    text, confidence, *layout = result
+    stored = {"text": text, "confidence": confidence}
+    if layout:
+        stored["has_layout"] = True
+        layout_cache.set(image_hash, layout[0])
+    if skipped_reason:
+        stored["skipped_reason"] = skipped_reason
+    result_cache.set(image_hash, stored)
+    if phash is not None:
+        near_duplicates.add(phash, image_hash)
+    extras = {"layout": layout[0]} if layout else {}
+    if bytes_saved:
+        extras["bytes_saved"] = bytes_saved
+    future.set_result({**stored, **extras} if extras else stored)
+
+
+def _prepare_sync(content: bytes) -> Prepared:
+    phash = None
+    try:
+        if settings.blank_check_enabled or settings.near_dup_enabled:
+            thumbnail = grayscale_thumbnail(content)
+            if settings.blank_check_enabled:
+                reason = blank_reason(thumbnail, settings.blank_max_stddev, settings.blank_min_edge_ratio)
+                if reason:
+                    return Prepared(reason, content, None)
+            if settings.near_dup_enabled:
+                phash = dhash(thumbnail, settings.near_dup_hash_size)
+        if settings.vision_preprocess:
+            payload = prepare_for_vision(
+                content, settings.vision_max_side, settings.vision_grayscale,
+                settings.vision_format, settings.vision_jpeg_quality,
+            )
+            return Prepared(None, payload, phash)
+    except Exception as e:
+        # Vision may still read images Pillow cannot fully decode.
+        logger.warning("ocr_prepare_failed", error=str(e))
+    return Prepared(None, content, phash)
+
+
+async def _prepare(content: bytes) -> Prepared:
+    """Runs the local pre-checks on the CPU pool: the blank check, the
+    perceptual hash and the optional downscaling, from one decode."""
+    if not (settings.blank_check_enabled or settings.near_dup_enabled or settings.vision_preprocess):
+        return Prepared(None, content, None)
+    with timer("preprocess"):
+        prepared = await cpu_pool.run(_prepare_sync, content)
+    if prepared.skipped_reason:
+        _count("skipped")
+    return prepared
+
+
+async def _near_duplicate(prepared: Prepared) -> dict | None:
+    if prepared.phash is None:
+        return None
+    digest = near_duplicates.lookup(prepared.phash)
+    if digest is None:
+        return None
+    cached = await result_cache.get_async(digest)
+    if cached is None:
+        return None
+    duplicate = {**cached, "near_duplicate_of": digest}
+    if cached.get("has_layout"):
+        duplicate["layout"] = layout_cache.get(digest)
+    return duplicate
+
+
+async def _resolve(future: Future, image_hash: str, content: bytes) -> None:
+    try:
+        prepared = await _prepare(content)
+        if prepared.skipped_reason:
+            _settle(future, image_hash, ("", 0.0), skipped_reason=prepared.skipped_reason)
+            return
+        duplicate = await _near_duplicate(prepared)
+        if duplicate is not None:
+            future.set_result(duplicate)
+            return
+        if _scheduler is not None:
+            result = await _call_shared(
+                [image_hash], "batch", lambda: asyncio.wrap_future(_scheduler.submit(prepared.payload))
+            )
+        else:
+            loop = asyncio.get_running_loop()
+            # Run in a copy of the context so the engine sees the deadline.
+            result = await _call_shared([image_hash], "single", lambda: loop.run_in_executor(
+                get_executor(), contextvars.copy_context().run, get_engine().extract_one, prepared.payload
+            ))
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        return
+    _settle(future, image_hash, result, len(content) - len(prepared.payload), phash=prepared.phash)
+
+
+async def _resolve_batch(chunk: list[tuple[str, bytes, Future]]) -> None:
+    try:
+        prepared = await asyncio.gather(*[_prepare(content) for _, content, _ in chunk])
+    except Exception as e:
+        for _, _, future in chunk:
+            future.set_exception(e)
+        return
+
+    pending = []
+    for (image_hash, content, future), item in zip(chunk, prepared):
+        if item.skipped_reason:
+            _settle(future, image_hash, ("", 0.0), skipped_reason=item.skipped_reason)
+            continue
+        duplicate = await _near_duplicate(item)
+        if duplicate is not None:
+            future.set_result(duplicate)
+            continue
+        pending.append((image_hash, content, future, item))
+    if not pending:
+        return
+
+    try:
+        loop = asyncio.get_running_loop()
+        payloads = [item.payload for _, _, _, item in pending]
+        hashes = [image_hash for image_hash, *_ in pending]
+        results = await _call_shared(hashes, "batch", lambda: loop.run_in_executor(
+            get_executor(), contextvars.copy_context().run, get_engine().extract, payloads
+        ))
+    except Exception as e:
+        results = [e] * len(pending)
+    for (image_hash, content, future, item), result in zip(pending, results):
+        _settle(future, image_hash, result, len(content) - len(item.payload), phash=item.phash)
+
+
+async def _lookup(image_hash: str, layout: bool = False) -> dict | None:
+    with timer("cache_lookup"):
+        cached = await result_cache.get_async(image_hash)
+        if layout and cached is not None and cached.get("has_layout"):
+            words = layout_cache.get(image_hash)
+            cached = None if words is None else {**cached, "layout": words}
+    cache_lookups.inc(result="miss" if cached is None else "hit")
+    return cached
+
+
+async def _wait(future: Future) -> dict:
+    # Shielded so a disconnecting client, or one whose deadline passes, does
+    # not cancel the shared call; it may still serve the other waiters.
+    return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=deadline.remaining())
+
+
+async def extract(image_hash: str, content: bytes, layout: bool = False) -> dict:
+    """Returns ``{"text", "confidence"}`` for an image, plus ``layout`` when
+    the engine reports word boxes (always when it was just read, from the
+    cache only with ``layout`` set), ``bytes_saved``
+    when the upload was shrunk before being sent to Vision,
+    ``skipped_reason`` when the pre-check found nothing to read and
+    ``near_duplicate_of`` when the result of a similar image was reused."""
+    cached = await _lookup(image_hash, layout)
+    if cached is not None:
+        return cached
+    future, owner = _claim(image_hash)
+    if owner:
+        task = asyncio.ensure_future(_resolve(future, image_hash, content))
+        # The event loop only keeps weak references to tasks.
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+    return await _wait(future)
+
+
+async def iter_extract(
+    items: list[tuple[str, bytes]], concurrency: int, layout: bool = False
+) -> AsyncIterator[tuple[int, dict | Exception]]:
+    """Extract many images through batch RPCs, yielding ``(index, result)``
+    as each result becomes available. Failures are yielded, not raised.
+    ``layout`` is as for `extract`."""
+    hits: dict[str, dict] = {}
+    positions: dict[str, list[int]] = {}
+    contents: dict[str, bytes] = {}
+    for index, (image_hash, content) in enumerate(items):
+        if image_hash in hits:
+            yield index, hits[image_hash]
+            continue
+        if image_hash in positions:
+            positions[image_hash].append(index)
+            continue
+        cached = await _lookup(image_hash, layout)
+        if cached is not None:
+            hits[image_hash] = cached
+            yield index, cached
+            continue
+        positions[image_hash] = [index]
+        contents[image_hash] = content
+
+    claimed: list[tuple[str, Future]] = []
+    owned: list[tuple[str, bytes, Future]] = []
+    for image_hash, content in contents.items():
+        future, owner = _claim(image_hash)
+        if owner:
+            owned.append((image_hash, content, future))
+        claimed.append((image_hash, future))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    size = settings.vision_batch_max_size
+
+    async def run(chunk: list[tuple[str, bytes, Future]]) -> None:
+        async with semaphore:
+            await _resolve_batch(chunk)
+
+    async def settle(image_hash: str, future: Future):
+        try:
+            return image_hash, await _wait(future)
+        except Exception as e:
+            return image_hash, e
+
+    tasks = [asyncio.ensure_future(run(owned[i:i + size])) for i in range(0, len(owned), size)]
+    try:
+        for next_done in asyncio.as_completed([settle(h, f) for h, f in claimed]):
+            image_hash, result = await next_done
+            for index in positions[image_hash]:
+                yield index, result
+    finally:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def get_stats() -> dict:
+    with _inflight_lock:
+        stats = {
+            **result_cache.stats(),
+            "layout_cache": layout_cache.stats(),
+            **_counters,
+            "in_flight": len(_inflight),
+        }
+    if settings.near_dup_enabled:
+        stats["near_duplicates"] = near_duplicates.stats()
+    if _scheduler is not None:
+        stats["batches"] = _scheduler.batches
+        stats["batched_images"] = _scheduler.batched_images
+    stats["backend"] = backend.stats()
+    if _engine is not None:
+        stats["engine"] = _engine.stats()
+    return stats
+
+
+def _call_options() -> dict:
+    # Retries are handled by `backend`; the request deadline bounds the RPC.
+    timeout = deadline.remaining()
+    return {"retry": None} if timeout is None else {"retry": None, "timeout": timeout}
+
+
+def _extract_batch(contents: list[bytes]) -> list[Result]:
+    from google.cloud import vision
+    client = get_client()
+    document_text = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+    requests = [
+        vision.AnnotateImageRequest(image=vision.Image(content=content), features=[document_text])
+        for content in contents
+    ]
+    response = client.batch_annotate_images(requests=requests, **_call_options())
+    logger.info("ocr_batch", size=len(contents))
+    return [
+        ValueError(r.error.message) if r.error.message else _parse_response(r)
+        for r in raw(response).responses
+    ]
+
+def _extract_text(content: bytes) -> tuple[str, float, dict]:
+    from google.cloud import vision
+    client = get_client()
     image = vision.Image(content=content)
     
-    response = client.document_text_detection(image=image)
+    response = raw(client.document_text_detection(image=image, **_call_options()))
     
     if response.error.message:
         raise ValueError(response.error.message)
     
-    if response.full_text_annotation:
-        full_text = response.full_text_annotation.text.strip()
-        confidences = []
-        for page in response.full_text_annotation.pages:
-            for block in page.blocks:
-                for paragraph in block.paragraphs:
-                    for word in paragraph.words:
-                        for symbol in word.symbols:
-                            if symbol.confidence:
-                                confidences.append(symbol.confidence)
-        avg_conf = sum(confidences) / len(confidences) if confidences else 0.0
-    else:
-        full_text, avg_conf = "", 0.0
-    
-    logger.info("ocr_success", text_len=len(full_text), confidence=round(avg_conf, 2))
-    return full_text, round(avg_conf, 2)
\ No newline at end of file
+    return _parse_response(response)
+
+
+def _parse_response(response) -> tuple[str, float, dict]:
+    with timer("decode_response"):
+        full_text, confidence, layout = decode(response)
+    logger.info("ocr_success", text_len=len(full_text), confidence=confidence)
+    return full_text, confidence, layout
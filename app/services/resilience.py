@@ -0,0 +1,258 @@
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+import asyncio
+import math
+import random
+import threading
+import time
+import structlog
+from app.utils import deadline
+from app.utils.exceptions import ServiceUnavailableError
+from app.utils.metrics import backend_errors, backend_retries, timer
+
+logger = structlog.get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class RetryBudget:
+    """Caps retries to a fraction of calls.
+
+    Every call deposits ``ratio`` tokens and every retry or hedge withdraws
+    one, so retries cannot exceed ``ratio`` of the traffic once the
+    ``reserve`` burst is used up. Shared by all callers of a backend.
+    """
+
+    def __init__(self, ratio: float, reserve: int):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._tokens = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.reserve, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """Fails fast after ``failure_threshold`` consecutive transient failures.
+
+    After ``reset_seconds`` a single probe call is let through; its outcome
+    closes the circuit again or keeps it open for another period.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info("circuit_closed")
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("circuit_opened", failures=self.failures)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Gives up a probe that ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            self._probing = False
+
+    def retry_after(self) -> int:
+        with self._lock:
+            if self.state != "open":
+                return 1
+            return max(1, math.ceil(self._opened_at + self.reset_seconds - time.monotonic()))
+
+
+class LatencyWindow:
+    """Latencies of the last ``size`` successful calls."""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> float | None:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientBackend:
+    """Retry, circuit breaking and hedging around calls to a remote backend.
+
+    Only errors accepted by ``is_transient`` are retried, after a full-jitter
+    exponential backoff and only while the shared retry budget allows it.
+    Failures once the caller's deadline has passed neither count toward the
+    circuit breaker nor are retried.
+    With ``hedge`` set, a second identical call is started once a call has
+    run longer than the p95 latency of its kind, and the first to succeed
+    wins. Calls are made by awaiting ``attempt()``, which must be safe to
+    repeat. Attempts are timed as ``stage`` and backoffs as ``retry_wait``.
+    """
+
+    def __init__(
+        self, name: str, is_transient: Callable[[BaseException], bool], attempts: int,
+        base_delay: float, max_delay: float, budget: RetryBudget, breaker: CircuitBreaker,
+        hedge: bool = False, hedge_min_samples: int = 20, stage: str = "backend",
+    ):
+        self.name = name
+        self.stage = stage
+        self.is_transient = is_transient
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breaker = breaker
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self._latency: dict[str, LatencyWindow] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "retries_denied": 0, "rejected": 0, "hedged": 0, "hedge_wins": 0}
+
+    async def call(self, kind: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        self._count("calls")
+        self.budget.deposit()
+        for number in range(1, self.attempts + 1):
+            if not self.breaker.allow():
+                self._count("rejected")
+                backend_errors.inc(kind="circuit_open")
+                raise ServiceUnavailableError(
+                    f"{self.name} is unavailable, please retry later.", retry_after=self.breaker.retry_after()
+                )
+            try:
+                with timer(self.stage):
+                    result = await self._hedged(kind, attempt)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not self.is_transient(e):
+                    # The backend answered; the request itself was bad.
+                    backend_errors.inc(kind="permanent")
+                    self.breaker.record_success()
+                    raise
+                if deadline.expired():
+                    # The caller ran out of time, which says nothing about
+                    # the backend's health.
+                    backend_errors.inc(kind="deadline")
+                    self.breaker.release()
+                    raise
+                backend_errors.inc(kind="transient")
+                self.breaker.record_failure()
+                if number == self.attempts:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (number - 1)))
+                left = deadline.remaining()
+                if left is not None and left <= delay:
+                    # A retry could not finish before the caller gives up.
+                    raise
+                if not self.budget.withdraw():
+                    self._count("retries_denied")
+                    raise
+                self._count("retries")
+                backend_retries.inc()
+                logger.warning("backend_retry", backend=self.name, attempt=number, delay=round(delay, 3), error=str(e))
+                with timer("retry_wait"):
+                    await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _hedged(self, kind: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        window = self._window(kind)
+        started = time.perf_counter()
+        first = asyncio.ensure_future(attempt())
+        delay = window.quantile(0.95, self.hedge_min_samples) if self.hedge else None
+        if delay is not None:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if not done and self.budget.withdraw():
+                self._count("hedged")
+                return await self._race(window, started, first, asyncio.ensure_future(attempt()))
+        try:
+            result = await first
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        window.add(time.perf_counter() - started)
+        return result
+
+    async def _race(self, window: LatencyWindow, started: float, first: asyncio.Future, second: asyncio.Future):
+        pending = {first, second}
+        error: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is second:
+                            self._count("hedge_wins")
+                        window.add(time.perf_counter() - started)
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _window(self, kind: str) -> LatencyWindow:
+        with self._lock:
+            return self._latency.setdefault(kind, LatencyWindow())
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def health(self) -> dict:
+        return {"circuit": self.breaker.state, "consecutive_failures": self.breaker.failures}
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            windows = dict(self._latency)
+        stats.update(self.health())
+        stats["p95_ms"] = {
+            kind: round(p95 * 1000, 1)
+            for kind, window in windows.items()
+            if (p95 := window.quantile(0.95, 1)) is not None
+        }
+        return stats
@@ -0,0 +1,95 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+import asyncio
+import os
+import threading
+import time
+from app.config import settings
+from app.utils.exceptions import ServiceUnavailableError
+
+
+def _timed(func: Callable, *args) -> tuple[Any, float]:
+    start = time.perf_counter()
+    return func(*args), time.perf_counter() - start
+
+
+class CPUPool:
+    """Runs CPU-bound steps (image decoding, EXIF, sanitizing) off the event
+    loop on a thread or process pool.
+
+    Work handed to ``run`` always waits for a worker, so an admitted request
+    never loses part of its work to a busy pool. Overload is shed earlier,
+    by ``check``, before a new request starts.
+    """
+
+    def __init__(self, kind: str, size: int, max_queue: int):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown CPU pool kind: {kind}")
+        self.kind = kind
+        self.size = size or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._started = time.monotonic()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.size)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="cpu")
+        return self._executor
+
+    def check(self) -> None:
+        """Rejects a new request with a 503 while more than ``max_queue``
+        tasks are already waiting for a worker."""
+        with self._lock:
+            if self._pending >= self.size + self.max_queue:
+                self._rejected += 1
+                raise ServiceUnavailableError("Server is busy, please retry shortly.", retry_after=1)
+
+    async def run(self, func: Callable, *args) -> Any:
+        with self._lock:
+            self._pending += 1
+        submitted = time.perf_counter()
+        try:
+            future = self._get_executor().submit(_timed, func, *args)
+            result, busy = await asyncio.wrap_future(future)
+        finally:
+            with self._lock:
+                self._pending -= 1
+        with self._lock:
+            self._completed += 1
+            self._busy_seconds += busy
+            self._wait_seconds += max(0.0, time.perf_counter() - submitted - busy)
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            uptime = time.monotonic() - self._started
+            return {
+                "kind": self.kind,
+                "size": self.size,
+                "active": min(self._pending, self.size),
+                "queued": max(0, self._pending - self.size),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "utilization": round(self._busy_seconds / (uptime * self.size), 4) if uptime else 0.0,
+                "avg_queue_wait_ms": round(self._wait_seconds / self._completed * 1000, 2) if self._completed else 0.0,
+            }
+
+
+cpu_pool = CPUPool(settings.cpu_pool_kind, settings.cpu_pool_size, settings.cpu_pool_max_queue)
@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+import time
+
+# Absolute time.monotonic() by which the current request must be answered.
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """Sets a deadline ``seconds`` from now for the block and the tasks it
+    starts. None leaves the request without one."""
+    with until(time.monotonic() + seconds if seconds is not None else None):
+        yield
+
+
+@contextmanager
+def until(when: float | None) -> Iterator[None]:
+    """Sets the deadline to the absolute ``time.monotonic()`` value ``when``."""
+    token = _deadline.set(when)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current() -> float | None:
+    """The current deadline as a ``time.monotonic()`` value, or None."""
+    return _deadline.get()
+
+
+def later(a: float | None, b: float | None) -> float | None:
+    """The later of two deadlines; None (no deadline) is later than any."""
+    return None if a is None or b is None else max(a, b)
+
+
+def remaining() -> float | None:
+    """Seconds left before the current deadline, or None without one."""
+    value = _deadline.get()
+    return None if value is None else max(0.0, value - time.monotonic())
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
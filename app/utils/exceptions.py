@@ -8,8 +8,31 @@ class ValidationError(HTTPException):
         )
 
 class RateLimitError(HTTPException):
-    def __init__(self, detail: str):
+    def __init__(self, detail: str, headers: dict[str, str] | None = None):
         super().__init__(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={"error": detail},
+            headers=headers
+        )
+
+class ForbiddenError(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail={"error": detail}
+        )
+
+class NotFoundError(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(
+            status_code=status.HTTP_404_NOT_FOUND,
             detail={"error": detail}
-        )
\ No newline at end of file
+        )
+
+class ServiceUnavailableError(HTTPException):
+    def __init__(self, detail: str, retry_after: int | None = None):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": detail},
+            headers={"Retry-After": str(retry_after)} if retry_after is not None else None
+        )
@@ -0,0 +1,110 @@
+from PIL import Image, ImageFilter, ImageOps, ImageSequence, ImageStat
+from typing import Iterator
+import hashlib
+import io
+
+THUMBNAIL_SIDE = 256
+# Scanner borders and page edges often leave a line along the sides.
+BLANK_MARGIN = 0.03
+# Contrast is measured per tile of the thumbnail: downscaling averages a
+# page number on an otherwise empty page down to almost nothing globally,
+# but not within its own tile.
+BLANK_TILE = 32
+EDGE_LEVEL = 32
+
+
+def flatten_alpha(img: Image.Image) -> Image.Image:
+    """Composites an image with transparency onto white. Dropping the alpha
+    instead leaves transparent pixels at their stored color, usually black,
+    which turns dark text on a transparent background into a black page."""
+    if img.mode not in ("RGBA", "LA", "PA", "RGBa", "La") and "transparency" not in img.info:
+        return img
+    img = img.convert("RGBA")
+    return Image.alpha_composite(Image.new("RGBA", img.size, "white"), img).convert("RGB")
+
+
+def prepare_for_vision(content: bytes, max_side: int, grayscale: bool, fmt: str, quality: int) -> bytes:
+    """Downscales, straightens and re-encodes an image before it is sent to
+    Vision. Returns the original bytes when re-encoding does not shrink them."""
+    with Image.open(io.BytesIO(content)) as img:
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale, which is much cheaper
+        # than decoding full size and resizing afterwards.
+        img.draft("L" if grayscale else "RGB", (max_side, max_side))
+        img = flatten_alpha(ImageOps.exif_transpose(img))
+        if grayscale:
+            img = img.convert("L")
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        out = io.BytesIO()
+        if fmt.upper() == "JPEG":
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+        else:
+            img.save(out, format="PNG", optimize=True)
+
+    payload = out.getvalue()
+    return payload if len(payload) < len(content) else content
+
+
+def grayscale_thumbnail(content: bytes, side: int = THUMBNAIL_SIDE) -> Image.Image:
+    with Image.open(io.BytesIO(content)) as img:
+        img.draft("L", (side, side))
+        img = flatten_alpha(img).convert("L")
+    img.thumbnail((side, side))
+    return img
+
+
+def _tiles(img: Image.Image) -> Iterator[Image.Image]:
+    for y in range(0, img.height, BLANK_TILE):
+        for x in range(0, img.width, BLANK_TILE):
+            yield img.crop((x, y, min(img.width, x + BLANK_TILE), min(img.height, y + BLANK_TILE)))
+
+
+def blank_reason(thumbnail: Image.Image, max_stddev: float, min_edge_ratio: float) -> str | None:
+    """Cheap check on a grayscale thumbnail for images with nothing to read.
+    Returns ``"blank"`` when every tile is near-uniform, ``"no_edges"`` when
+    no tile has any sharp structure, or None when the image should be
+    OCR'd."""
+    width, height = thumbnail.size
+    dx, dy = int(width * BLANK_MARGIN), int(height * BLANK_MARGIN)
+    img = thumbnail.crop((dx, dy, width - dx, height - dy))
+    if all(ImageStat.Stat(tile).stddev[0] < max_stddev for tile in _tiles(img)):
+        return "blank"
+
+    # FIND_EDGES leaves the outermost pixels unfiltered, so drop them.
+    edges = img.filter(ImageFilter.FIND_EDGES).crop((1, 1, img.width - 1, img.height - 1))
+    if edges.width > 0 and edges.height > 0 and not any(
+        sum(tile.histogram()[EDGE_LEVEL:]) / (tile.width * tile.height) >= min_edge_ratio for tile in _tiles(edges)
+    ):
+        return "no_edges"
+    return None
+
+
+def dhash(thumbnail: Image.Image, hash_size: int) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a
+    ``(hash_size + 1) x hash_size`` downscale. Re-encoded or resized copies
+    of an image differ in only a few bits."""
+    small = thumbnail.resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def split_pages(content: bytes) -> list[tuple[str, bytes]]:
+    """Splits a multi-page TIFF or animated GIF into one PNG per frame.
+    Returns ``(sha256, png_bytes)`` for each page."""
+    pages = []
+    with Image.open(io.BytesIO(content)) as img:
+        for frame in ImageSequence.Iterator(img):
+            if frame.mode not in ("1", "L", "P", "RGB", "RGBA"):
+                frame = frame.convert("RGB")
+            out = io.BytesIO()
+            frame.save(out, format="PNG")
+            page = out.getvalue()
+            pages.append((hashlib.sha256(page).hexdigest(), page))
+    return pages
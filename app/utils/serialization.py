@@ -0,0 +1,42 @@
+from fastapi.responses import JSONResponse
+from numbers import Rational
+from typing import Any
+import json
+import math
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    """Encodes the few non-JSON types that can reach a response."""
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, Rational):
+        number = float(value)
+        return number if math.isfinite(number) else None
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    """Serializes a response body in one pass, with orjson when it is
+    installed and the stdlib encoder otherwise."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response that skips FastAPI's ``jsonable_encoder`` pass."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def envelope(data: dict | None, status_code: int = 200, error: str = "") -> dict:
+    """The ``APIResponse`` body as a plain dict, without building the model."""
+    return {"success": not error, "status_code": status_code, "data": data, "error": error}
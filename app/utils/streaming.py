@@ -0,0 +1,25 @@
+from app.utils.serialization import dumps
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def stream_format(accept: str | None, requested: str | None) -> str | None:
+    """Picks the streaming format from the ``stream`` query flag, falling
+    back to the Accept header. Returns None for a regular JSON response."""
+    if requested:
+        return requested
+    accept = accept or ""
+    for fmt, media_type in MEDIA_TYPES.items():
+        if media_type in accept:
+            return fmt
+    return None
+
+
+def encode_event(fmt: str, payload: dict, event: str = "result") -> bytes:
+    body = dumps(payload)
+    if fmt == "sse":
+        return b"event: " + event.encode() + b"\ndata: " + body + b"\n\n"
+    return body + b"\n"
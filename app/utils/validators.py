@@ -1,12 +1,22 @@
 from app.utils.exceptions import ValidationError
 from fastapi import UploadFile
 from PIL import Image, ExifTags
+from numbers import Rational
 import io
-import bleach
+import hashlib
+import html
+import math
+import time
 from app.config import settings
+from app.utils.cpu_pool import cpu_pool
+from app.utils.metrics import record, timer
 
+CHUNK_SIZE = 1024 * 1024
 
-async def validate_image(image: UploadFile) -> tuple[bytes, dict]:
+
+async def validate_image(image: UploadFile) -> tuple[bytes, dict, str]:
+    """Reads an upload in chunks, rejecting it as soon as it passes the size
+    limit. Returns the content, its metadata and its SHA-256 hex digest."""
     if not image:
         raise ValidationError("No image uploaded.")
 
@@ -15,34 +25,97 @@ async def validate_image(image: UploadFile) -> tuple[bytes, dict]:
             f"Unsupported format: {image.content_type}. Supported: {', '.join(settings.supported_formats)}"
         )
 
-    content = await image.read()
-    if not content:
+    limit = settings.max_file_size_mb * 1024 * 1024
+    if image.size is not None and image.size > limit:
+        raise ValidationError("File exceeds size limit.")
+
+    digest = hashlib.sha256()
+    chunks = []
+    received = 0
+    hashing = 0.0
+    start = time.perf_counter()
+    while chunk := await image.read(CHUNK_SIZE):
+        received += len(chunk)
+        if received > limit:
+            raise ValidationError("File exceeds size limit.")
+        hash_start = time.perf_counter()
+        digest.update(chunk)
+        hashing += time.perf_counter() - hash_start
+        chunks.append(chunk)
+    record("upload_read", time.perf_counter() - start - hashing)
+    record("hashing", hashing)
+
+    if not received:
         raise ValidationError("Uploaded file is empty or unreadable.")
 
-    # ✅ Check file size
-    if len(content) > settings.max_file_size_mb * 1024 * 1024:
-        raise ValidationError("File exceeds size limit.")
+    content = b"".join(chunks)
+    with timer("decode"):
+        metadata = await cpu_pool.run(inspect_image, content)
+    return content, metadata, digest.hexdigest()
+
+
+def exif_value(value):
+    """Converts an EXIF value to JSON types once, so responses need no
+    special encoding. Binary blobs longer than ``EXIF_MAX_VALUE_BYTES``
+    (maker notes, ICC profiles, XMP packets) are replaced by their size."""
+    if isinstance(value, bytes):
+        if len(value) > settings.exif_max_value_bytes:
+            return f"<{len(value)} bytes>"
+        return value.decode("utf-8", errors="replace").rstrip("\x00")
+    if isinstance(value, Rational) and not isinstance(value, int):
+        number = float(value)
+        return number if math.isfinite(number) else None
+    if isinstance(value, (tuple, list)):
+        return [exif_value(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): exif_value(v) for k, v in value.items()}
+    return value
 
+
+def inspect_image(content: bytes) -> dict:
+    """Reads format, size, mode and EXIF from the image header, then checks
+    the file structure, without decoding the pixel data."""
     try:
-        image_stream = io.BytesIO(content)
-        with Image.open(image_stream) as img:
-            img.verify() 
-            img = Image.open(io.BytesIO(content))
+        with Image.open(io.BytesIO(content)) as img:
+            # PNG keeps EXIF after the pixel data unless it is in the header;
+            # asking for it otherwise decodes the whole image.
+            if img.format == "PNG" and "exif" not in img.info:
+                exif = {}
+            else:
+                exif = img.getexif() or {}
             metadata = {
                 "format": img.format,
                 "size": img.size,
                 "mode": img.mode,
-                "exif": {
-                    ExifTags.TAGS.get(k, k): v for k, v in (img.getexif() or {}).items()
-                } if hasattr(img, "getexif") else {}
+                "frames": getattr(img, "n_frames", 1),
+                "exif": {str(ExifTags.TAGS.get(k, k)): exif_value(v) for k, v in exif.items()}
             }
+            img.verify()
     except Exception as e:
         raise ValidationError(f"Invalid or corrupted image: {str(e)}")
 
-    return content, metadata
+    if metadata["frames"] > settings.max_frames:
+        raise ValidationError(f"Image has {metadata['frames']} frames. Max {settings.max_frames}.")
+
+    return metadata
 
 
 def preprocess_text(text: str) -> str:
     """Cleans up and sanitizes extracted text"""
+    # Imported here: bleach loads html5lib, which slows down startup.
+    import bleach
     text = text.strip().replace("\n", " ")
     return bleach.clean(text)
+
+
+def sanitize_words(words: list[str]) -> list[str]:
+    """Escapes markup in layout words. Words are escaped one by one, not
+    cleaned as a whole like ``preprocess_text``: a tag that bleach allows
+    could otherwise span several words."""
+    return [html.escape(word, quote=False) for word in words]
+
+
+def warm_up() -> None:
+    """Loads Pillow's common decoders and bleach ahead of the first upload."""
+    Image.preinit()
+    preprocess_text("warm-up")
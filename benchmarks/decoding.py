@@ -0,0 +1,122 @@
+"""Benchmark of Vision response decoding.
+
+Builds a synthetic ``AnnotateImageResponse`` of a dense document and times
+the previous decoder, a nested loop over the proto-plus wrappers that only
+kept the text and the mean confidence, against ``app.services.decoding``,
+which reads the raw protobuf and also collects the word layout::
+
+    python -m benchmarks.decoding --words 2000,20000 --output decoding.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from google.cloud import vision
+
+from app.services.decoding import decode
+from benchmarks.load import git_commit
+
+
+def make_response(words: int, symbols_per_word: int, seed: int = 1) -> vision.AnnotateImageResponse:
+    """One page of ``words`` words in paragraphs of 50 and blocks of 4."""
+    rng = random.Random(seed)
+    entries = []
+    for i in range(words):
+        x, y = (i % 100) * 20, (i // 100) * 15
+        entries.append({
+            "confidence": rng.random(),
+            "bounding_box": {"vertices": [
+                {"x": x, "y": y}, {"x": x + 18, "y": y}, {"x": x + 18, "y": y + 12}, {"x": x, "y": y + 12},
+            ]},
+            "symbols": [{"text": "a", "confidence": rng.random()} for _ in range(symbols_per_word)],
+        })
+    paragraphs = [{"words": entries[i:i + 50]} for i in range(0, words, 50)]
+    blocks = [{"paragraphs": paragraphs[i:i + 4]} for i in range(0, len(paragraphs), 4)]
+    text = " ".join("a" * symbols_per_word for _ in range(words))
+    return vision.AnnotateImageResponse(full_text_annotation={
+        "text": text, "pages": [{"width": 2000, "height": (words // 100 + 1) * 15, "blocks": blocks}],
+    })
+
+
+def legacy_decode(response) -> tuple[str, float]:
+    """The decoder this benchmark is measured against."""
+    if response.full_text_annotation:
+        full_text = response.full_text_annotation.text.strip()
+        confidences = []
+        for page in response.full_text_annotation.pages:
+            for block in page.blocks:
+                for paragraph in block.paragraphs:
+                    for word in paragraph.words:
+                        for symbol in word.symbols:
+                            if symbol.confidence:
+                                confidences.append(symbol.confidence)
+        avg_conf = sum(confidences) / len(confidences) if confidences else 0.0
+    else:
+        full_text, avg_conf = "", 0.0
+    return full_text, round(avg_conf, 2)
+
+
+def time_ms(func, response, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(response)
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def run_case(words: int, symbols_per_word: int, repeat: int) -> dict:
+    response = make_response(words, symbols_per_word)
+    text, confidence, _ = decode(response)
+    if (text, confidence) != legacy_decode(response):
+        raise AssertionError("decoders disagree")
+    legacy_ms = time_ms(legacy_decode, response, repeat)
+    decode_ms = time_ms(decode, response, repeat)
+    return {
+        "words": words,
+        "symbols": words * symbols_per_word,
+        "legacy_ms": legacy_ms,
+        "decode_ms": decode_ms,
+        "speedup": round(legacy_ms / decode_ms, 2) if decode_ms else None,
+    }
+
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=lambda v: [int(s) for s in v.split(",")], default=[500, 5000, 20000])
+    parser.add_argument("--symbols-per-word", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per decoder, the median is kept")
+    parser.add_argument("--output", default="decoding-results.json")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    args = parse_args(argv)
+    results = [run_case(words, args.symbols_per_word, args.repeat) for words in args.words]
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for result in results:
+        print(
+            f"{result['words']:>7} words  legacy {result['legacy_ms']:>9.2f} ms  "
+            f"decode {result['decode_ms']:>8.2f} ms  x{result['speedup']}",
+            file=sys.stderr,
+        )
+    print(f"wrote {args.output}", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
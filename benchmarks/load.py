@@ -0,0 +1,248 @@
+"""Load benchmark for the OCR API against a simulated Vision backend.
+
+Runs the ASGI app in-process under concurrent load for every combination
+of image size and cache hit ratio, and writes throughput and latency
+percentiles to a JSON file that can be compared between commits::
+
+    python -m benchmarks.load --scenario extract --concurrency 32 \\
+        --image-sizes 640x480,2000x1500 --hit-ratios 0,0.9 --output before.json
+    python -m benchmarks.load ... --output after.json --compare before.json
+"""
+from contextlib import ExitStack
+from unittest.mock import MagicMock, patch
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Keep benchmark runs away from the service's real cache file.
+os.environ.setdefault("CACHE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="ocr-bench-"), "cache.sqlite3"))
+
+import httpx
+import structlog
+from PIL import Image, ImageDraw
+
+from app.main import app
+from app.middleware.rate_limiter import limiter
+from app.services import ocr
+from benchmarks.simulated_vision import SimulatedVision
+
+
+def make_image(size: tuple[int, int], seed: int) -> bytes:
+    """A text-like page, unique per seed so each one has its own digest."""
+    rng = random.Random(seed)
+    img = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(img)
+    line_height = max(12, size[1] // 40)
+    for y in range(line_height, size[1] - line_height, line_height * 2):
+        words = " ".join(f"{rng.randrange(10 ** 6):06d}" for _ in range(max(1, size[0] // 60)))
+        draw.text((line_height, y), words, fill=0)
+    draw.text((line_height, 2), f"page {seed}", fill=0)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+class Workload:
+    """Hands out images so that about ``hit_ratio`` of them repeat an
+    image already sent, and are served from the result cache."""
+
+    def __init__(self, size: tuple[int, int], hit_ratio: float, unique: int, seed: int):
+        self.hit_ratio = hit_ratio
+        self._random = random.Random(seed)
+        self._images = [make_image(size, seed * 100_000 + i) for i in range(unique)]
+        self._sent = 0
+
+    def next_image(self) -> bytes:
+        if self._sent and self._random.random() < self.hit_ratio:
+            return self._images[self._random.randrange(self._sent)]
+        image = self._images[self._sent % len(self._images)]
+        self._sent += 1
+        return image
+
+
+async def run_load(client: httpx.AsyncClient, args, workload: Workload) -> dict:
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    remaining = args.requests + args.warmup
+    measured_from = args.warmup
+
+    async def send() -> int:
+        if args.scenario == "batch":
+            files = [("images", (f"{i}.jpg", workload.next_image(), "image/jpeg")) for i in range(args.batch_size)]
+            response = await client.post("/batch-extract", files=files)
+        else:
+            files = {"image": ("page.jpg", workload.next_image(), "image/jpeg")}
+            response = await client.post("/extract-text", files=files)
+        return response.status_code
+
+    async def worker():
+        nonlocal remaining, measured_from
+        while remaining > 0:
+            remaining -= 1
+            warmup = measured_from > 0
+            measured_from -= 1
+            start = time.perf_counter()
+            status_code = await send()
+            if not warmup:
+                latencies.append(time.perf_counter() - start)
+                statuses[status_code] = statuses.get(status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    images = len(ordered) * (args.batch_size if args.scenario == "batch" else 1)
+    return {
+        "requests": len(ordered),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "images_per_s": round(images / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+            "p50": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        },
+    }
+
+
+async def run_case(args, size: tuple[int, int], hit_ratio: float) -> dict:
+    backend = SimulatedVision(args.latency_ms, args.jitter_ms, args.error_rate, args.text_size, seed=args.seed)
+    per_request = args.batch_size if args.scenario == "batch" else 1
+    workload = Workload(size, hit_ratio, (args.requests + args.warmup) * per_request, args.seed)
+    ocr.result_cache.clear()
+    ocr.near_duplicates.clear()
+    limiter.reset()
+
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(ocr, "_extract_text", backend.extract_text))
+        stack.enter_context(patch.object(ocr, "_extract_batch", backend.extract_batch))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            result = await run_load(client, args, workload)
+
+    return {
+        "scenario": args.scenario,
+        "image_size": f"{size[0]}x{size[1]}",
+        "hit_ratio": hit_ratio,
+        **result,
+        "backend": backend.stats(),
+        "cache_hit_ratio": ocr.result_cache.stats()["hit_ratio"],
+    }
+
+
+async def run(args) -> list[dict]:
+    results = []
+    async with app.router.lifespan_context(app):
+        for size in args.image_sizes:
+            for hit_ratio in args.hit_ratios:
+                result = await run_case(args, size, hit_ratio)
+                latency = result["latency_ms"]
+                print(
+                    f"{result['scenario']:8} {result['image_size']:>10} hit={hit_ratio:<4} "
+                    f"{result['throughput_rps']:>9.1f} req/s  p50={latency['p50']:.1f}ms "
+                    f"p95={latency['p95']:.1f}ms p99={latency['p99']:.1f}ms",
+                    file=sys.stderr,
+                )
+                results.append(result)
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {
+            (r["scenario"], r["image_size"], r["hit_ratio"]): r for r in json.load(f)["results"]
+        }
+    for result in results:
+        before = baseline.get((result["scenario"], result["image_size"], result["hit_ratio"]))
+        if before is None:
+            continue
+        rps = result["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+        p99 = result["latency_ms"]["p99"] / before["latency_ms"]["p99"] - 1 if before["latency_ms"]["p99"] else 0.0
+        print(
+            f"{result['scenario']:8} {result['image_size']:>10} hit={result['hit_ratio']:<4} "
+            f"throughput {rps:+.1%}  p99 {p99:+.1%}",
+            file=sys.stderr,
+        )
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["extract", "batch"], default="extract")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per case")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per case")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=8, help="images per /batch-extract request")
+    parser.add_argument("--image-sizes", type=lambda v: [parse_size(s) for s in v.split(",")],
+                        default=[(640, 480), (1600, 1200)])
+    parser.add_argument("--hit-ratios", type=lambda v: [float(s) for s in v.split(",")], default=[0.0, 0.5, 0.9])
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="simulated Vision latency per RPC")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of RPCs failing transiently")
+    parser.add_argument("--text-size", type=int, default=200, help="characters returned per image")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    args = parse_args(argv)
+    # Per-request log lines would dominate the timings.
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    # The simulated backend replaces every RPC; no real client is needed.
+    with patch.object(limiter, "enabled", False), \
+            patch("google.cloud.vision.ImageAnnotatorClient", MagicMock()):
+        results = asyncio.run(run(args))
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "compare")
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}", file=sys.stderr)
+    if args.compare:
+        compare(results, args.compare)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Benchmark of response serialization.
+
+Encodes representative ``/extract-text`` and ``/batch-extract`` bodies with
+the previous path (``APIResponse`` model, ``model_dump`` and
+``JSONResponse``) and with the current one (plain dicts encoded once by
+``FastJSONResponse``), and with the ``lean`` and ``fields=text`` options.
+The previous path gets the EXIF as ``inspect_image`` used to return it,
+with raw byte blobs; the current paths get it normalized::
+
+    python -m benchmarks.serialization --batch-size 16 --output serialization.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from fastapi.responses import JSONResponse
+
+from app.main import APIResponse, response_fields, select
+from app.utils.serialization import FastJSONResponse, envelope
+from app.utils.validators import exif_value
+from benchmarks.load import git_commit
+
+
+def make_exif(blob_bytes: int) -> dict:
+    """EXIF of a phone photo: camera tags plus a maker note blob."""
+    return {
+        "Make": "Canon", "Model": "Canon EOS 80D", "Orientation": 1, "XResolution": 72.0, "YResolution": 72.0,
+        "ResolutionUnit": 2, "Software": "Firmware Version 1.0.2", "DateTime": "2024:05:01 10:22:13",
+        "YCbCrPositioning": 2, "ExifOffset": 240, "GPSInfo": 9140,
+        "MakerNote": b"M" * blob_bytes, "PrintImageMatching": b"P" * (blob_bytes // 4),
+    }
+
+
+def make_result(text_size: int, layout_words: int, blob_bytes: int) -> dict:
+    result = {
+        "text": ("LOREM IPSUM " * (text_size // 12 + 1))[:text_size],
+        "confidence": 0.93,
+        "processing_time_ms": 412,
+        "metadata": {
+            "format": "JPEG", "size": (4000, 3000), "mode": "RGB", "frames": 1, "exif": make_exif(blob_bytes),
+        },
+    }
+    if layout_words:
+        result["layout"] = {
+            "pages": [{"width": 4000, "height": 3000}],
+            "words": {
+                "text": ["LOREM"] * layout_words, "confidence": [0.93] * layout_words,
+                "page": [0] * layout_words, "block": list(range(layout_words)),
+                "paragraph": list(range(layout_words)),
+                "x0": list(range(layout_words)), "y0": list(range(layout_words)),
+                "x1": list(range(layout_words)), "y1": list(range(layout_words)),
+            },
+        }
+    return result
+
+
+def normalized(result: dict) -> dict:
+    metadata = result["metadata"]
+    return {**result, "metadata": {**metadata, "exif": {k: exif_value(v) for k, v in metadata["exif"].items()}}}
+
+
+def legacy(data: dict) -> bytes:
+    response = APIResponse(success=True, status_code=200, data=data)
+    return JSONResponse(content=response.model_dump(mode="json")).body
+
+
+def fast(data: dict, keep: frozenset[str] | None = None) -> bytes:
+    return FastJSONResponse(envelope(data if keep is None else select(data, keep))).body
+
+
+def batch(results: list[dict], keep: frozenset[str] | None = None) -> dict:
+    return {"results": [select(result, keep) for result in results]}
+
+
+def time_us(func, repeat: int) -> tuple[float, int]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func()
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return round(statistics.median(samples), 1), len(body)
+
+
+def run_case(name: str, raw: list[dict], repeat: int) -> list[dict]:
+    clean = [normalized(result) for result in raw]
+    lean, text_only = response_fields(None, True), response_fields("text", False)
+    if name == "single":
+        paths = {
+            "legacy": lambda: legacy(dict(raw[0])),
+            "fast": lambda: fast(clean[0]),
+            "lean": lambda: fast(clean[0], lean),
+            "fields=text": lambda: fast(clean[0], text_only),
+        }
+    else:
+        paths = {
+            "legacy": lambda: legacy({"results": raw}),
+            "fast": lambda: fast(batch(clean)),
+            "lean": lambda: fast(batch(clean, lean)),
+            "fields=text": lambda: fast(batch(clean, text_only)),
+        }
+    rows = []
+    for path, func in paths.items():
+        median_us, size = time_us(func, repeat)
+        rows.append({"case": name, "path": path, "bytes": size, "median_us": median_us})
+    return rows
+
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--text-size", type=int, default=2000, help="characters of text per result")
+    parser.add_argument("--layout-words", type=int, default=0, help="words of layout per result (0 = none)")
+    parser.add_argument("--blob-bytes", type=int, default=8192, help="size of the EXIF maker note")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", default="serialization-results.json")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    args = parse_args(argv)
+    result = make_result(args.text_size, args.layout_words, args.blob_bytes)
+    results = run_case("single", [result], args.repeat)
+    results += run_case("batch", [result] * args.batch_size, args.repeat)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for row in results:
+        print(f"{row['case']:6} {row['path']:12} {row['bytes']:>9} bytes {row['median_us']:>10.1f} us", file=sys.stderr)
+    print(f"wrote {args.output}", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
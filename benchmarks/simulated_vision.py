@@ -0,0 +1,48 @@
+from google.api_core import exceptions as api_exceptions
+import random
+import threading
+import time
+
+
+class SimulatedVision:
+    """Stand-in for the Vision calls in ``app.services.ocr``.
+
+    Sleeps for ``latency_ms`` (+/- ``jitter_ms``) per RPC, which is what a
+    real call costs a worker thread, fails with a transient error at
+    ``error_rate`` and returns ``text_size`` characters per image.
+    """
+
+    def __init__(self, latency_ms: float, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 text_size: int = 200, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.text = ("LOREM IPSUM " * (text_size // 12 + 1))[:text_size]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.images = 0
+        self.errors = 0
+
+    def _rpc(self, images: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.images += images
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        time.sleep(delay / 1000)
+        if failed:
+            raise api_exceptions.ServiceUnavailable("simulated outage")
+
+    def extract_text(self, content: bytes) -> tuple[str, float]:
+        self._rpc(1)
+        return self.text, 0.93
+
+    def extract_batch(self, contents: list[bytes]) -> list[tuple[str, float]]:
+        self._rpc(len(contents))
+        return [(self.text, 0.93)] * len(contents)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "images": self.images, "errors": self.errors}
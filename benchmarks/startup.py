@@ -0,0 +1,163 @@
+"""Cold start benchmark for the OCR API.
+
+Starts fresh processes and measures how long ``import app.main`` takes and,
+for a new uvicorn server, how long it takes until it accepts connections,
+until ``/health`` reports ready and until its first OCR request succeeds.
+Results are written to a JSON file tagged with the git commit::
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+    # against the real backend (needs credentials)
+    GOOGLE_APPLICATION_CREDENTIALS=./credentials/vision_key.json \\
+        python -m benchmarks.startup --engine vision --output startup-vision.json
+
+The default ``stub`` engine measures the service's own startup without
+network calls.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.load import git_commit, make_image
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def measure_import() -> float:
+    """Seconds a fresh interpreter spends importing ``app.main``."""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def parse_importtime(output: str) -> list[dict]:
+    """Parses ``python -X importtime`` output into one entry per module."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_ms": round(int(self_us) / 1000, 2),
+            "cumulative_ms": round(int(cumulative_us) / 1000, 2),
+        })
+    return modules
+
+
+def slowest_imports(limit: int) -> list[dict]:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True, text=True, check=True
+    ).stderr
+    return sorted(parse_importtime(stderr), key=lambda m: m["self_ms"], reverse=True)[:limit]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_server(engine: str, timeout: float, image: bytes) -> dict:
+    """Starts a server and times it from process start to the first OCR."""
+    port = free_port()
+    state_dir = tempfile.mkdtemp(prefix="ocr-startup-")
+    env = {
+        **os.environ,
+        "OCR_ENGINE": engine,
+        # A fresh cache, so the first request really goes to the engine.
+        "CACHE_DB_PATH": os.path.join(state_dir, "cache.sqlite3"),
+        "RATE_LIMIT_DB_PATH": os.path.join(state_dir, "rate_limit.sqlite3"),
+    }
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    def elapsed_ms() -> float:
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    try:
+        listening_ms = ready_ms = None
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            while ready_ms is None:
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"server was not ready within {timeout}s")
+                if process.poll() is not None:
+                    raise RuntimeError(f"server exited with status {process.returncode}")
+                try:
+                    response = client.get("/health")
+                except httpx.TransportError:
+                    time.sleep(0.01)
+                    continue
+                listening_ms = listening_ms or elapsed_ms()
+                if response.status_code == 200:
+                    ready_ms = elapsed_ms()
+                else:
+                    time.sleep(0.01)
+
+            sent = time.perf_counter()
+            response = client.post("/extract-text", files={"image": ("page.jpg", image, "image/jpeg")})
+            return {
+                "listening_ms": listening_ms,
+                "ready_ms": ready_ms,
+                "first_ocr_ms": elapsed_ms(),
+                "first_ocr_request_ms": round((time.perf_counter() - sent) * 1000, 1),
+                "first_ocr_status": response.status_code,
+            }
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def summarize(values: list[float]) -> dict:
+    return {"median": round(statistics.median(values), 1), "min": min(values), "max": max(values)}
+
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--engine", default="stub", help="OCR_ENGINE of the measured server")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for a server to get ready")
+    parser.add_argument("--top-imports", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--output", default="startup-results.json")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    args = parse_args(argv)
+    imports = [round(measure_import() * 1000, 1) for _ in range(args.runs)]
+    image = make_image((640, 480), seed=1)
+    servers = [measure_server(args.engine, args.timeout, image) for _ in range(args.runs)]
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "import_ms": summarize(imports),
+        "server": {
+            key: summarize([run[key] for run in servers])
+            for key in ("listening_ms", "ready_ms", "first_ocr_ms", "first_ocr_request_ms")
+        },
+        "first_ocr_statuses": [run["first_ocr_status"] for run in servers],
+        "slowest_imports": slowest_imports(args.top_imports),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,63 @@
+import os
+import tempfile
 import pytest
-from unittest.mock import Mock
+from unittest.mock import patch
 from fastapi.testclient import TestClient
 from PIL import Image, ImageDraw
 from pathlib import Path
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("CACHE_DB_PATH", os.path.join(_tmp, "ocr_cache.sqlite3"))
+os.environ.setdefault("RATE_LIMIT_DB_PATH", os.path.join(_tmp, "ocr_rate_limit.sqlite3"))
+os.environ.setdefault("PROFILING_DIR", os.path.join(_tmp, "profiles"))
+
 from app.main import app
 
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    from app.middleware.rate_limiter import limiter
+    limiter.reset()
+
 @pytest.fixture
 def client():
     return TestClient(app)
 
+@pytest.fixture
+def app_client():
+    """Client that runs the app lifespan (job workers, shared Vision client)."""
+    with patch('google.cloud.vision.ImageAnnotatorClient'), TestClient(app) as c:
+        yield c
+
+def build_vision_response(text: str, words: list[tuple[str, list[float], tuple[int, int, int, int]]]):
+    """A Vision response with one page, block and paragraph holding
+    ``words`` as ``(text, symbol confidences, (x0, y0, x1, y1))``."""
+    from google.cloud import vision
+    return vision.AnnotateImageResponse(full_text_annotation={"text": text, "pages": [{
+        "width": 400, "height": 200,
+        "blocks": [{"paragraphs": [{"words": [
+            {
+                "confidence": sum(confidences) / len(confidences),
+                "bounding_box": {"vertices": [
+                    {"x": x0, "y": y0}, {"x": x1, "y": y0}, {"x": x1, "y": y1}, {"x": x0, "y": y1},
+                ]},
+                "symbols": [{"text": char, "confidence": c} for char, c in zip(word, confidences)],
+            }
+            for word, confidences, (x0, y0, x1, y1) in words
+        ]}]}],
+    }]})
+
+@pytest.fixture
+def vision_response():
+    return build_vision_response
+
 @pytest.fixture
 def mock_vision_success():
-    mock_response = Mock()
-    mock_response.full_text_annotation = Mock(text="HELLO WORLD OCR API")
-    mock_response.full_text_annotation.pages = [
-        Mock(blocks=[Mock(paragraphs=[Mock(words=[Mock(symbols=[
-            Mock(confidence=0.95),
-            Mock(confidence=0.96)
-        ])])])])
-    ]
-    mock_response.error.message = ""  # No error
-    return mock_response
+    return build_vision_response("HELLO WORLD OCR API", [("HE", [0.95, 0.96], (50, 80, 70, 92))])
 
 @pytest.fixture
 def mock_vision_empty():
-    mock_response = Mock()
-    mock_response.full_text_annotation = None
-    mock_response.error.message = ""  # No error
-    return mock_response
+    from google.cloud import vision
+    return vision.AnnotateImageResponse()
 
 @pytest.fixture
 def create_test_images(tmp_path):
@@ -57,6 +87,16 @@ def create_test_images(tmp_path):
     with open(fixtures / 'large.jpg', 'wb') as f:
         f.write(b'A' * 11_000_000)
     
+    pages = []
+    for label in ('PAGE ONE', 'PAGE TWO', 'PAGE THREE'):
+        page = Image.new('L', (400, 200), 'white')
+        ImageDraw.Draw(page).text((50, 80), label, fill='black')
+        pages.append(page)
+    pages[0].save(fixtures / 'multipage.tiff', save_all=True, append_images=pages[1:])
+    data = (fixtures / 'multipage.tiff').read_bytes()
+    # Passes verify(), which does not decode frames, but fails to split.
+    (fixtures / 'truncated.tiff').write_bytes(data[:-100])
+    
     with open(fixtures / 'invalid.pdf', 'w') as f:
         f.write('%PDF-1.0\ninvalid')
     
@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from app.services.admission import AdmissionController, Ticket
+from app.utils import deadline
+from app.utils.exceptions import ServiceUnavailableError
+
+
+def controller(limit=1, max_queue=8):
+    return AdmissionController(limit, min_limit=1, max_limit=8, max_queue=max_queue, tolerance=2.0)
+
+
+@pytest.mark.asyncio
+class TestAdmissionController:
+    async def test_waiting_clients_served_round_robin(self):
+        admission = controller()
+        order = []
+        release = asyncio.Event()
+
+        async def request(client, name):
+            async with admission.admit(client):
+                order.append(name)
+                if name == "a1":
+                    await release.wait()
+
+        first = asyncio.ensure_future(request("a", "a1"))
+        await asyncio.sleep(0)
+        waiting = [asyncio.ensure_future(request(c, n)) for c, n in [("a", "a2"), ("a", "a3"), ("b", "b1")]]
+        await asyncio.sleep(0.01)
+        assert admission.stats()["queued"] == 3
+        release.set()
+        await asyncio.gather(first, *waiting)
+
+        assert order == ["a1", "a2", "b1", "a3"]
+        assert admission.stats()["active"] == 0
+
+    async def test_rejects_when_queue_full(self):
+        admission = controller(max_queue=0)
+        async with admission.admit("a"):
+            with pytest.raises(ServiceUnavailableError) as exc_info:
+                async with admission.admit("b"):
+                    pass
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers["Retry-After"] == "1"
+        assert admission.stats()["rejected_queue_full"] == 1
+
+    async def test_deadline_expires_while_queued(self):
+        admission = controller()
+        async with admission.admit("a"):
+            with deadline.deadline(0.01):
+                with pytest.raises(ServiceUnavailableError):
+                    async with admission.admit("b"):
+                        pass
+        stats = admission.stats()
+        assert stats["expired_in_queue"] == 1
+        assert stats["queued"] == 0 and stats["active"] == 0
+
+    async def test_rejects_requests_that_cannot_meet_deadline(self):
+        admission = controller()
+        admission._service_seconds = 2.0
+        with deadline.deadline(0.5):
+            with pytest.raises(ServiceUnavailableError):
+                async with admission.admit("a"):
+                    pass
+        assert admission.stats()["rejected_deadline"] == 1
+
+    async def test_deadline_exceeded_during_processing_is_503(self):
+        admission = controller()
+        with deadline.deadline(0.01):
+            with pytest.raises(ServiceUnavailableError) as exc_info:
+                async with admission.admit("a"):
+                    await asyncio.sleep(0.02)
+                    raise TimeoutError("vision timed out")
+        assert "deadline" in exc_info.value.detail["error"]
+        assert admission.limit == 1
+
+    async def test_expired_client_deadline_does_not_shrink_limit(self):
+        admission = controller(limit=4)
+        with deadline.deadline(0.01):
+            with pytest.raises(ServiceUnavailableError):
+                async with admission.admit("a"):
+                    await asyncio.sleep(0.02)
+                    raise ServiceUnavailableError("OCR backend is unavailable.")
+        assert admission.limit == 4
+
+
+class TestAdaptiveLimit:
+    def test_limit_grows_with_steady_latency_and_backs_off(self):
+        admission = controller(limit=4)
+        for _ in range(10):
+            ticket = Ticket()
+            ticket.backend_seconds = 0.2
+            admission._adjust(ticket)
+        grown = admission.limit
+        assert grown > 4
+
+        slow = Ticket()
+        slow.backend_seconds = 1.0
+        admission._adjust(slow)
+        assert admission.limit == pytest.approx(grown * 0.9)
+
+        overloaded = Ticket()
+        overloaded.overloaded = True
+        admission._adjust(overloaded)
+        assert admission.limit == pytest.approx(grown * 0.81)
+
+
+class TestDeadlineHeader:
+    def test_deadline_bounds_vision_timeout(self, client, create_test_images, mock_vision_empty):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        with patch('app.services.ocr.get_client') as mock_client:
+            mock_client.return_value.document_text_detection.return_value = mock_vision_empty
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                response = client.post(
+                    "/extract-text", files={"image": ("test.jpg", f)}, headers={"X-Request-Timeout": "5"}
+                )
+
+        assert response.status_code == 200
+        kwargs = mock_client.return_value.document_text_detection.call_args.kwargs
+        assert 0 < kwargs["timeout"] <= 5
+        assert kwargs["retry"] is None
+
+    def test_invalid_deadline_header(self, client, create_test_images):
+        with open(create_test_images / 'test.jpg', "rb") as f:
+            response = client.post(
+                "/extract-text", files={"image": ("test.jpg", f)}, headers={"X-Request-Timeout": "soon"}
+            )
+        assert response.status_code == 422
+
+    def test_stream_holds_admission_slot(self, client, create_test_images):
+        from app.main import admission
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        admitted = admission.stats()["admitted"]
+        remaining = []
+
+        def extract_batch(contents):
+            remaining.append(deadline.remaining())
+            return [("TEXT", 0.9)] * len(contents)
+
+        with patch('app.services.ocr._extract_batch', side_effect=extract_batch):
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                response = client.post(
+                    "/extract-text?stream=ndjson", files={"image": ("test.jpg", f)}, headers={"X-Request-Timeout": "5"}
+                )
+
+        assert response.status_code == 200
+        assert remaining and 0 < remaining[0] <= 5
+        stats = admission.stats()
+        assert stats["admitted"] == admitted + 1
+        assert stats["active"] == 0
+
+    def test_stream_refused_when_admission_queue_full(self, client, create_test_images):
+        busy = controller(max_queue=0)
+        busy._active = 1
+        with patch('app.main.admission', busy), open(create_test_images / 'test.jpg', "rb") as f:
+            response = client.post(
+                "/extract-text", files={"image": ("test.jpg", f)}, headers={"Accept": "application/x-ndjson"}
+            )
+        assert response.status_code == 503
+        assert busy.stats()["rejected_queue_full"] == 1
@@ -0,0 +1,84 @@
+import json
+import structlog
+from benchmarks.load import Workload, main, percentile
+
+
+class TestBenchmarks:
+    def test_percentile(self):
+        ordered = [float(i) for i in range(1, 101)]
+        assert percentile(ordered, 0.5) == 50.0
+        assert percentile(ordered, 0.99) == 99.0
+        assert percentile([], 0.5) == 0.0
+    
+    def test_workload_repeats_images(self):
+        workload = Workload((64, 48), hit_ratio=1.0, unique=4, seed=1)
+        first = workload.next_image()
+        assert all(workload.next_image() == first for _ in range(5))
+    
+    def test_smoke_run_writes_report(self, tmp_path):
+        output = tmp_path / "results.json"
+        try:
+            main([
+                "--requests", "4", "--warmup", "0", "--concurrency", "2", "--image-sizes", "64x48",
+                "--hit-ratios", "0,1", "--latency-ms", "1", "--jitter-ms", "0", "--output", str(output),
+            ])
+        finally:
+            structlog.reset_defaults()
+        
+        report = json.loads(output.read_text())
+        assert len(report["results"]) == 2
+        miss, hit = report["results"]
+        assert miss["statuses"] == {"200": 4}
+        assert miss["backend"]["images"] == 4
+        assert hit["backend"]["images"] == 1
+        assert {"p50", "p95", "p99"} <= miss["latency_ms"].keys()
+
+
+class TestStartupBenchmark:
+    def test_parse_importtime(self):
+        from benchmarks.startup import parse_importtime
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   zipimport\n"
+            "import time:      2500 |      40000 | app.main\n"
+        )
+        assert parse_importtime(output) == [
+            {"module": "zipimport", "self_ms": 0.12, "cumulative_ms": 0.12},
+            {"module": "app.main", "self_ms": 2.5, "cumulative_ms": 40.0},
+        ]
+    
+    def test_smoke_run_writes_report(self, tmp_path):
+        from benchmarks.startup import main as startup
+        output = tmp_path / "startup.json"
+        startup(["--runs", "1", "--top-imports", "3", "--timeout", "30", "--output", str(output)])
+        
+        report = json.loads(output.read_text())
+        assert report["first_ocr_statuses"] == [200]
+        server = report["server"]
+        assert server["listening_ms"]["median"] <= server["ready_ms"]["median"] <= server["first_ocr_ms"]["median"]
+        assert len(report["slowest_imports"]) == 3
+
+
+class TestDecodingBenchmark:
+    def test_smoke_run_writes_report(self, tmp_path):
+        from benchmarks.decoding import main as decoding
+        output = tmp_path / "decoding.json"
+        decoding(["--words", "120", "--repeat", "1", "--output", str(output)])
+        
+        result, = json.loads(output.read_text())["results"]
+        assert result["words"] == 120
+        assert result["symbols"] == 600
+        assert result["legacy_ms"] > 0 and result["decode_ms"] > 0
+
+
+class TestSerializationBenchmark:
+    def test_smoke_run_writes_report(self, tmp_path):
+        from benchmarks.serialization import main as serialization
+        output = tmp_path / "serialization.json"
+        serialization(["--batch-size", "2", "--repeat", "2", "--layout-words", "5", "--output", str(output)])
+        
+        rows = {(row["case"], row["path"]): row for row in json.loads(output.read_text())["results"]}
+        assert len(rows) == 8
+        # The maker note blob is summarized instead of encoded.
+        assert rows["single", "fast"]["bytes"] < rows["single", "legacy"]["bytes"]
+        assert rows["batch", "fields=text"]["bytes"] < rows["batch", "fast"]["bytes"]
@@ -0,0 +1,80 @@
+import pytest
+from unittest.mock import patch
+from app.services.cache import ResultCache
+
+class TestResultCache:
+    def test_memory_hit(self):
+        cache = ResultCache(memory_max_bytes=1024, disk_max_bytes=1024, ttl_seconds=60)
+        assert cache.get("a") is None
+        cache.set("a", ["text", 0.9])
+        assert cache.get("a") == ["text", 0.9]
+        stats = cache.stats()
+        assert stats["memory_hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+    
+    def test_evicts_by_bytes(self):
+        cache = ResultCache(memory_max_bytes=30, disk_max_bytes=1024, ttl_seconds=60)
+        cache.set("a", ["x" * 10, 0.9])
+        cache.set("b", ["y" * 10, 0.9])
+        assert cache.get("a") is None
+        assert cache.get("b") == ["y" * 10, 0.9]
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["memory_bytes"] <= 30
+    
+    def test_ttl_expiry(self):
+        cache = ResultCache(memory_max_bytes=1024, disk_max_bytes=1024, ttl_seconds=10)
+        with patch("app.services.cache.time.time", return_value=1000.0):
+            cache.set("a", ["text", 0.9])
+        with patch("app.services.cache.time.time", return_value=1011.0):
+            assert cache.get("a") is None
+        assert cache.stats()["expired"] == 1
+    
+    def test_disk_tier_survives_restart(self, tmp_path):
+        db_path = str(tmp_path / "cache.sqlite3")
+        first = ResultCache(memory_max_bytes=1024, disk_max_bytes=1024, ttl_seconds=60, db_path=db_path)
+        first.set("a", ["persisted", 0.8])
+        first.flush()
+        
+        second = ResultCache(memory_max_bytes=1024, disk_max_bytes=1024, ttl_seconds=0, db_path=db_path)
+        assert second.get("a") == ["persisted", 0.8]
+        assert second.get("a") == ["persisted", 0.8]
+        stats = second.stats()
+        assert stats["disk_hits"] == 1
+        assert stats["memory_hits"] == 1
+    
+    def test_disk_tier_trimmed_to_budget(self, tmp_path):
+        cache = ResultCache(memory_max_bytes=1024, disk_max_bytes=100, ttl_seconds=0, db_path=str(tmp_path / "c.db"))
+        with patch.object(ResultCache, "TRIM_EVERY", 1):
+            for i in range(10):
+                cache.set(f"k{i}", ["x" * 20, 0.5])
+            cache.flush()
+        total = cache._db.execute("SELECT SUM(size) FROM results").fetchone()[0]
+        assert total <= 100
+        assert cache._db.execute("SELECT 1 FROM results WHERE key = 'k9'").fetchone() is not None
+    
+    def test_disk_size_tracked_without_scans(self, tmp_path):
+        cache = ResultCache(memory_max_bytes=1024, disk_max_bytes=60, ttl_seconds=0, db_path=str(tmp_path / "c.db"))
+        cache.set("a", ["x" * 20, 0.5])
+        cache.set("a", ["x" * 30, 0.5])
+        cache.set("b", ["y" * 20, 0.5])
+        cache.flush()
+        tracked = cache._db.execute("SELECT value FROM cache_meta WHERE name = 'bytes'").fetchone()[0]
+        assert tracked == cache._db.execute("SELECT SUM(size) FROM results").fetchone()[0]
+        
+        # "a" is read, so "b" is now the least recently used row.
+        cache._memory.clear()
+        assert cache.get("a") == ["x" * 30, 0.5]
+        cache._io.submit(cache._trim_disk, 2000.0).result()
+        assert [row[0] for row in cache._db.execute("SELECT key FROM results")] == ["a"]
+    
+    @pytest.mark.asyncio
+    async def test_get_async_reads_disk_tier(self, tmp_path):
+        db_path = str(tmp_path / "cache.sqlite3")
+        first = ResultCache(memory_max_bytes=1024, disk_max_bytes=1024, ttl_seconds=60, db_path=db_path)
+        first.set("a", ["persisted", 0.8])
+        first.flush()
+        second = ResultCache(memory_max_bytes=1024, disk_max_bytes=1024, ttl_seconds=60, db_path=db_path)
+        assert await second.get_async("a") == ["persisted", 0.8]
+        assert await second.get_async("b") is None
+        assert second.stats()["disk_hits"] == 1
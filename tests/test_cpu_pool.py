@@ -0,0 +1,41 @@
+import asyncio
+import time
+import pytest
+from app.utils.cpu_pool import CPUPool
+from app.utils.exceptions import ServiceUnavailableError
+from app.utils.validators import inspect_image
+
+@pytest.mark.asyncio
+class TestCPUPool:
+    async def test_runs_off_loop(self):
+        pool = CPUPool("thread", 2, 4)
+        try:
+            assert await pool.run(sum, [1, 2, 3]) == 6
+            stats = pool.stats()
+            assert stats["completed"] == 1
+            assert stats["active"] == 0
+        finally:
+            pool.shutdown()
+    
+    async def test_process_pool(self, create_test_images):
+        pool = CPUPool("process", 1, 4)
+        try:
+            metadata = await pool.run(inspect_image, (create_test_images / 'test.jpg').read_bytes())
+            assert metadata["size"] == (400, 200)
+        finally:
+            pool.shutdown()
+    
+    async def test_rejects_new_requests_when_queue_full(self):
+        pool = CPUPool("thread", 1, 0)
+        try:
+            slow = asyncio.ensure_future(pool.run(time.sleep, 0.2))
+            await asyncio.sleep(0.01)
+            with pytest.raises(ServiceUnavailableError) as exc_info:
+                pool.check()
+            assert exc_info.value.headers["Retry-After"] == "1"
+            # Work of admitted requests waits for a worker instead.
+            assert await pool.run(sum, [1]) == 1
+            await slow
+            assert pool.stats()["rejected"] == 1
+        finally:
+            pool.shutdown()
@@ -0,0 +1,32 @@
+from app.services.decoding import WORD_COLUMNS, decode, raw
+
+
+class TestDecoding:
+    def test_decode_collects_word_columns(self, vision_response):
+        response = vision_response("HI THERE", [
+            ("HI", [0.9, 0.8], (10, 20, 40, 32)),
+            ("THERE", [1.0, 0.0, 0.9, 0.9, 0.9], (50, 20, 120, 32)),
+        ])
+        text, confidence, layout = decode(response)
+        
+        assert text == "HI THERE"
+        # Symbols without a confidence are left out of the mean.
+        assert confidence == 0.9
+        words = layout["words"]
+        assert tuple(words) == WORD_COLUMNS
+        assert words["text"] == ["HI", "THERE"]
+        assert words["confidence"] == [0.85, 0.74]
+        assert words["page"] == words["block"] == words["paragraph"] == [0, 0]
+        assert (words["x0"], words["y0"], words["x1"], words["y1"]) == ([10, 50], [20, 20], [40, 120], [32, 32])
+        assert layout["pages"] == [{"width": 400, "height": 200}]
+    
+    def test_decode_accepts_raw_protobuf(self, vision_response):
+        response = vision_response("OK", [("OK", [0.5, 0.7], (0, 0, 10, 10))])
+        assert raw(raw(response)) is raw(response)
+        assert decode(raw(response)) == decode(response)
+    
+    def test_decode_empty_response(self, mock_vision_empty):
+        text, confidence, layout = decode(mock_vision_empty)
+        assert (text, confidence) == ("", 0.0)
+        assert layout["pages"] == []
+        assert all(column == [] for column in layout["words"].values())
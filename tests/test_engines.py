@@ -0,0 +1,111 @@
+import subprocess
+import pytest
+from unittest.mock import Mock, patch
+from app.services.engines import OCREngine, RoutingEngine, StubEngine, TesseractEngine, parse_tsv
+
+TSV = (
+    "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n"
+    "1\t1\t0\t0\t0\t0\t0\t0\t400\t200\t-1\t\n"
+    "5\t1\t1\t1\t1\t1\t10\t10\t50\t20\t96.0\tHELLO\n"
+    "5\t1\t1\t1\t1\t2\t70\t10\t50\t20\t90.0\tWORLD\n"
+    "5\t1\t1\t1\t2\t1\t10\t40\t50\t20\t84.0\tOCR\n"
+)
+
+
+class FixedEngine(OCREngine):
+    name = "fixed"
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def extract(self, images):
+        self.calls.append(images)
+        return [self.results[image] for image in images]
+
+
+class TestEngines:
+    def test_stub_is_deterministic(self):
+        engine = StubEngine()
+        first = engine.extract([b"one", b"two"])
+        assert first == engine.extract([b"one", b"two"])
+        assert first[0] != first[1]
+        assert engine.extract_one(b"one") == first[0]
+
+    def test_engine_must_implement_extract(self):
+        class Incomplete(OCREngine):
+            name = "incomplete"
+        
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    def test_parse_tsv(self):
+        assert parse_tsv(TSV) == ("HELLO WORLD\nOCR", 0.9)
+        assert parse_tsv(TSV.splitlines()[0]) == ("", 0.0)
+
+    def test_tesseract_runs_cli(self):
+        with patch("app.services.engines.shutil.which", return_value="/usr/bin/tesseract"), \
+                patch("app.services.engines.subprocess.run") as mock_run:
+            mock_run.side_effect = [
+                Mock(returncode=0, stdout=TSV.encode()),
+                Mock(returncode=1, stderr=b"Error in pixReadMem"),
+            ]
+            engine = TesseractEngine("tesseract", "eng", workers=1, timeout=5)
+            try:
+                results = engine.extract([b"good", b"bad"])
+            finally:
+                engine.close()
+
+        assert results[0] == ("HELLO WORLD\nOCR", 0.9)
+        assert isinstance(results[1], ValueError)
+        assert mock_run.call_args_list[0].kwargs["input"] == b"good"
+
+    def test_tesseract_timeout_is_transient(self):
+        with patch("app.services.engines.shutil.which", return_value="/usr/bin/tesseract"), \
+                patch("app.services.engines.subprocess.run", side_effect=subprocess.TimeoutExpired("tesseract", 5)):
+            engine = TesseractEngine("tesseract", "eng", workers=1, timeout=5)
+            try:
+                with pytest.raises(TimeoutError):
+                    engine.extract_one(b"slow")
+            finally:
+                engine.close()
+
+    def test_tesseract_missing(self):
+        with patch("app.services.engines.shutil.which", return_value=None):
+            with pytest.raises(RuntimeError):
+                TesseractEngine("tesseract", "eng", workers=1, timeout=5)
+
+    def test_routing_falls_back_on_low_confidence(self):
+        local = FixedEngine({b"easy": ("EASY", 0.95), b"hard": ("H4RD", 0.4), b"broken": ValueError("bad")})
+        fallback = FixedEngine({b"hard": ("HARD", 0.9), b"broken": ("FIXED", 0.8)})
+        engine = RoutingEngine(local, fallback, min_confidence=0.8)
+
+        results = engine.extract([b"easy", b"hard", b"broken"])
+
+        assert results == [("EASY", 0.95), ("HARD", 0.9), ("FIXED", 0.8)]
+        assert fallback.calls == [[b"hard", b"broken"]]
+        assert engine.extract_one(b"easy") == ("EASY", 0.95)
+        assert engine.stats() == {"engine": "routing", "served_locally": 2, "fell_back": 2}
+
+
+@pytest.mark.asyncio
+class TestEngineSelection:
+    async def test_stub_engine_end_to_end(self):
+        from app.config import settings
+        from app.services.ocr import close_client, extract, get_engine, result_cache
+        result_cache.clear()
+        close_client()
+        try:
+            with patch.object(settings, "ocr_engine", "stub"):
+                assert get_engine().name == "stub"
+                result = await extract("stub-digest", b"offline")
+        finally:
+            close_client()
+
+        assert result["text"].startswith("STUB ")
+        assert result["confidence"] == 0.99
+
+    async def test_unknown_engine(self):
+        from app.services.ocr import build_engine
+        with pytest.raises(ValueError):
+            build_engine("magic")
@@ -0,0 +1,106 @@
+import io
+from pathlib import Path
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+from app.utils.imaging import blank_reason, dhash, grayscale_thumbnail, prepare_for_vision, split_pages
+
+SAMPLES = Path(__file__).parent.parent / "samples"
+
+def _encode(img, fmt, **kwargs):
+    out = io.BytesIO()
+    img.save(out, format=fmt, **kwargs)
+    return out.getvalue()
+
+class TestPrepareForVision:
+    def test_downscales_and_grayscales(self):
+        content = _encode(Image.new("RGB", (3000, 1500), "white"), "BMP")
+        payload = prepare_for_vision(content, 1000, True, "PNG", 90)
+        with Image.open(io.BytesIO(payload)) as img:
+            assert img.size == (1000, 500)
+            assert img.mode == "L"
+            assert img.format == "PNG"
+        assert len(payload) < len(content)
+    
+    def test_applies_exif_orientation(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90° clockwise
+        content = _encode(Image.new("RGB", (400, 200), "white"), "JPEG", exif=exif)
+        payload = prepare_for_vision(content, 100, True, "JPEG", 90)
+        with Image.open(io.BytesIO(payload)) as img:
+            assert img.size == (50, 100)
+    
+    def test_flattens_transparency_onto_white(self):
+        img = Image.new("RGBA", (400, 200), (0, 0, 0, 0))
+        ImageDraw.Draw(img).text((50, 80), "HELLO WORLD", fill=(0, 0, 0, 255))
+        payload = prepare_for_vision(_encode(img, "PNG"), 400, True, "PNG", 90)
+        with Image.open(io.BytesIO(payload)) as out:
+            assert out.getpixel((0, 0)) == 255
+            assert out.getextrema()[0] < 128
+    
+    def test_keeps_original_when_not_smaller(self):
+        content = _encode(Image.new("L", (20, 20), "white"), "PNG", optimize=True)
+        assert prepare_for_vision(content, 2048, True, "JPEG", 100) == content
+
+
+class TestBlankReason:
+    @pytest.mark.parametrize("sample,expected", [
+        ("blank.png", "blank"),
+        ("test.png", None),
+        ("rotated.png", None),
+    ])
+    def test_samples(self, sample, expected):
+        assert blank_reason(grayscale_thumbnail((SAMPLES / sample).read_bytes()), 1.0, 0.0005) == expected
+    
+    def test_small_text_is_not_blank(self):
+        img = Image.new("RGB", (400, 200), "white")
+        ImageDraw.Draw(img).text((50, 80), "HELLO WORLD", fill="black")
+        assert blank_reason(grayscale_thumbnail(_encode(img, "JPEG")), 1.0, 0.0005) is None
+    
+    @pytest.mark.parametrize("size", [12, 16, 20])
+    def test_page_number_on_full_page_scan_is_not_blank(self, size):
+        # A4 at 300 dpi with nothing but a footer.
+        img = Image.new("RGB", (2480, 3508), "white")
+        ImageDraw.Draw(img).text((1100, 3300), "Page 2 of 3", fill="black", font=ImageFont.load_default(size=size))
+        assert blank_reason(grayscale_thumbnail(_encode(img, "JPEG")), 1.0, 0.0005) is None
+    
+    @pytest.mark.parametrize("mode,background,ink", [
+        ("RGBA", (0, 0, 0, 0), (0, 0, 0, 255)),
+        ("LA", (0, 0), (0, 255)),
+    ])
+    def test_text_on_transparent_background_is_not_blank(self, mode, background, ink):
+        img = Image.new(mode, (400, 200), background)
+        ImageDraw.Draw(img).text((50, 80), "HELLO WORLD", fill=ink)
+        assert blank_reason(grayscale_thumbnail(_encode(img, "PNG")), 1.0, 0.0005) is None
+    
+    def test_smooth_gradient_has_no_edges(self):
+        content = _encode(Image.linear_gradient("L"), "PNG")
+        assert blank_reason(grayscale_thumbnail(content), 1.0, 0.0005) == "no_edges"
+
+
+class TestDHash:
+    def test_recompressed_copy_is_close(self):
+        original = (SAMPLES / "test.png").read_bytes()
+        with Image.open(io.BytesIO(original)) as img:
+            copy = _encode(img.convert("RGB").resize((img.width // 2, img.height // 2)), "JPEG", quality=60)
+        
+        a = dhash(grayscale_thumbnail(original), 16)
+        b = dhash(grayscale_thumbnail(copy), 16)
+        c = dhash(grayscale_thumbnail((SAMPLES / "rotated.png").read_bytes()), 16)
+        assert bin(a ^ b).count("1") <= 10
+        assert bin(a ^ c).count("1") > 10
+
+
+class TestSplitPages:
+    def test_multipage_tiff(self, create_test_images):
+        pages = split_pages((create_test_images / "multipage.tiff").read_bytes())
+        assert len(pages) == 3
+        assert len({digest for digest, _ in pages}) == 3
+        with Image.open(io.BytesIO(pages[1][1])) as img:
+            assert img.format == "PNG"
+            assert img.size == (400, 200)
+    
+    def test_animated_gif(self):
+        frames = [Image.new("RGB", (40, 40), color) for color in ("white", "black")]
+        out = io.BytesIO()
+        frames[0].save(out, format="GIF", save_all=True, append_images=frames[1:])
+        assert len(split_pages(out.getvalue())) == 2
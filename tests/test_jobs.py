@@ -0,0 +1,128 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import patch
+from app.services.jobs import JobManager
+from app.utils.exceptions import ServiceUnavailableError
+
+async def _echo(items, start_time):
+    for index, value in items:
+        yield index, {"text": value}
+
+@pytest.mark.asyncio
+class TestJobManager:
+    async def test_processes_job(self):
+        manager = JobManager(_echo, workers=1, max_queue=4, max_retained=10)
+        await manager.start()
+        try:
+            job = manager.submit([None, {"error": "bad"}, None], [(0, "a"), (2, "c")])
+            assert job["completed"] == 1
+            for _ in range(100):
+                if manager.get(job["job_id"])["status"] == "completed":
+                    break
+                await asyncio.sleep(0.01)
+            job = manager.get(job["job_id"])
+            assert job["status"] == "completed"
+            assert job["completed"] == 3
+            assert job["results"] == [{"text": "a"}, {"error": "bad"}, {"text": "c"}]
+        finally:
+            await manager.stop()
+    
+    async def test_rejects_when_queue_full(self):
+        manager = JobManager(_echo, workers=0, max_queue=1, max_retained=10)
+        await manager.start()
+        try:
+            manager.submit([None], [(0, "a")])
+            with pytest.raises(ServiceUnavailableError):
+                manager.submit([None], [(0, "b")])
+        finally:
+            await manager.stop()
+    
+    async def test_rejects_when_pending_bytes_exceeded(self):
+        manager = JobManager(_echo, workers=0, max_queue=8, max_retained=10, max_pending_bytes=100)
+        await manager.start()
+        try:
+            # A lone job larger than the budget is still accepted.
+            manager.submit([None], [(0, "a")], size=150)
+            with pytest.raises(ServiceUnavailableError):
+                manager.submit([None], [(0, "b")], size=1)
+            assert manager.stats()["queued"] == 1
+        finally:
+            await manager.stop()
+    
+    async def test_check_before_submit(self):
+        manager = JobManager(_echo, workers=0, max_queue=2, max_retained=10, max_pending_bytes=100)
+        await manager.start()
+        try:
+            manager.check(150)
+            manager.submit([None], [(0, "a")], size=60)
+            manager.check(40)
+            with pytest.raises(ServiceUnavailableError):
+                manager.check(41)
+            manager.submit([None], [(0, "b")], size=40)
+            with pytest.raises(ServiceUnavailableError):
+                manager.check()
+        finally:
+            await manager.stop()
+    
+    async def test_pending_bytes_released_when_done(self):
+        manager = JobManager(_echo, workers=1, max_queue=8, max_retained=10, max_pending_bytes=100)
+        await manager.start()
+        try:
+            job = manager.submit([None], [(0, "a")], size=80)
+            for _ in range(100):
+                if manager.get(job["job_id"])["status"] == "completed":
+                    break
+                await asyncio.sleep(0.01)
+            manager.submit([None], [(0, "b")], size=80)
+        finally:
+            await manager.stop()
+    
+    async def test_rejects_when_not_running(self):
+        manager = JobManager(_echo, workers=1, max_queue=1, max_retained=10)
+        with pytest.raises(ServiceUnavailableError):
+            manager.submit([None], [(0, "a")])
+
+class TestJobEndpoints:
+    def test_submit_and_poll(self, app_client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with open(create_test_images / 'test.jpg', "rb") as f:
+            content = f.read()
+        with patch('app.services.ocr._extract_batch') as mock_extract:
+            mock_extract.side_effect = lambda contents: [("JOB TEXT", 0.9)] * len(contents)
+            response = app_client.post("/jobs", files=[("images", ("test.jpg", content, "image/jpeg"))])
+            assert response.status_code == 202
+            job_id = response.json()["data"]["job_id"]
+            
+            for _ in range(100):
+                data = app_client.get(f"/jobs/{job_id}").json()["data"]
+                if data["status"] == "completed":
+                    break
+                time.sleep(0.02)
+        
+        assert data["status"] == "completed"
+        assert data["results"][0]["text"] == "JOB TEXT"
+    
+    def test_unknown_job(self, app_client):
+        response = app_client.get("/jobs/missing")
+        assert response.status_code == 404
+        assert "not found" in response.json()["error"]
+    
+    def test_full_queue_refused_before_validation(self, app_client, create_test_images):
+        from app.main import jobs
+        with open(create_test_images / 'test.jpg', "rb") as f:
+            content = f.read()
+        with patch.object(jobs, "max_pending_bytes", 1), patch.object(jobs, "_pending_bytes", 1), \
+                patch('app.main.validate_uploads') as mock_validate:
+            response = app_client.post("/jobs", files=[("images", ("test.jpg", content, "image/jpeg"))])
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+        mock_validate.assert_not_called()
+    
+    def test_requires_running_queue(self, client, create_test_images):
+        with open(create_test_images / 'test.jpg', "rb") as f:
+            response = client.post("/jobs", files={"images": ("test.jpg", f, "image/jpeg")})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
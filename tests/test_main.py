@@ -1,12 +1,29 @@
+import json
 import pytest
 from unittest.mock import patch, Mock
 from fastapi.testclient import TestClient
 
 class TestAPIEndpoints:
-    def test_health(self, client):
+    def test_health(self, app_client):
+        from app.main import ready
+        assert ready.wait(5)
+        response = app_client.get("/health")
+        assert response.status_code == 200
+        assert response.json() == {
+            "status": "healthy",
+            "vision": {"circuit": "closed", "consecutive_failures": 0},
+        }
+    
+    def test_health_not_ready_before_warm_up(self, client):
+        # Without the lifespan no warm-up has run.
         response = client.get("/health")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+    
+    def test_stats(self, client):
+        response = client.get("/stats")
         assert response.status_code == 200
-        assert response.json() == {"status": "healthy"}
+        assert {"hits", "misses", "coalesced", "in_flight"} <= response.json()["ocr"].keys()
     
     @pytest.mark.parametrize("filename,expect_success", [
         ("test.jpg", True),
@@ -33,8 +50,8 @@ class TestAPIEndpoints:
             assert "error" in json_response or "detail" in json_response
     
     def test_extract_text_success(self, client, create_test_images):
-        from app.services.ocr import cached_extract
-        cached_extract.cache_clear()
+        from app.services.ocr import result_cache
+        result_cache.clear()
         
         with patch('app.services.ocr._extract_text') as mock_extract:
             mock_extract.return_value = ("HELLO WORLD", 0.95)
@@ -47,10 +64,95 @@ class TestAPIEndpoints:
         assert data["text"] == "HELLO WORLD"
         assert data["confidence"] == 0.95
         assert data["processing_time_ms"] >= 0 
+        assert {"upload_read", "hashing", "decode", "cache_lookup", "vision_rpc", "postprocess"} <= data["timings_ms"].keys()
+    
+    def test_extract_text_layout(self, client, create_test_images, mock_vision_success):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with patch('app.services.ocr.get_client') as mock_client:
+            mock_client.return_value.document_text_detection.return_value = mock_vision_success
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                plain = client.post("/extract-text", files={"image": ("test.jpg", f)})
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                response = client.post("/extract-text?layout=true", files={"image": ("test.jpg", f)})
+        
+        assert "layout" not in plain.json()["data"]
+        # The cached layout serves the second request without another call.
+        mock_client.return_value.document_text_detection.assert_called_once()
+        layout = response.json()["data"]["layout"]
+        assert layout["pages"] == [{"width": 400, "height": 200}]
+        assert layout["words"]["text"] == ["HE"]
+        assert (layout["words"]["x0"], layout["words"]["y1"]) == ([50], [92])
+    
+    def test_layout_words_are_sanitized(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        layout = {"pages": [], "words": {"text": ["<b>", "x"], "confidence": [0.9, 0.9]}}
+        
+        with patch('app.services.ocr._extract_text', return_value=("<b> x", 0.9, layout)):
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                response = client.post("/extract-text?layout=true", files={"image": ("test.jpg", f)})
+        
+        assert response.json()["data"]["layout"]["words"]["text"] == ["&lt;b&gt;", "x"]
+    
+    def test_extract_text_fields(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with patch('app.services.ocr._extract_text', return_value=("LEAN", 0.9)):
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                fields = client.post("/extract-text?fields=text", files={"image": ("test.jpg", f)})
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                lean = client.post("/extract-text?lean=true", files={"image": ("test.jpg", f)})
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                unknown = client.post("/extract-text?fields=text,exif", files={"image": ("test.jpg", f)})
+        
+        assert fields.json()["data"] == {"text": "LEAN"}
+        assert set(lean.json()["data"]) == {"text", "confidence", "processing_time_ms"}
+        assert unknown.status_code == 422
+        assert "exif" in unknown.json()["error"]
+    
+    def test_batch_extract_fields(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with open(create_test_images / 'test.jpg', "rb") as f:
+            good = f.read()
+        
+        with patch('app.services.ocr._extract_batch', side_effect=lambda cs: [("X", 0.9)] * len(cs)):
+            files = [("images", ("test.jpg", good, "image/jpeg")), ("images", ("bad.pdf", b"%PDF", "application/pdf"))]
+            response = client.post("/batch-extract?fields=text,confidence", files=files)
+            streamed = client.post("/batch-extract?stream=ndjson&lean=true", files=files[:1])
+        
+        data = response.json()["data"]
+        assert "timings_ms" not in data
+        assert data["results"][0] == {"text": "X", "confidence": 0.9}
+        # Errors are kept whatever the selection.
+        assert "error" in data["results"][1]
+        line = json.loads(streamed.text.splitlines()[0])
+        assert set(line) == {"index", "text", "confidence", "processing_time_ms"}
+    
+    def test_metrics(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with patch('app.services.ocr._extract_text', return_value=("METRICS", 0.9)):
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                client.post("/extract-text", files={"image": ("test.jpg", f)})
+        
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert 'ocr_stage_duration_seconds_bucket{stage="vision_rpc",le="+Inf"}' in body
+        assert 'ocr_cache_lookups_total{result="miss"}' in body
+        assert 'http_request_duration_seconds_count{method="POST",route="/extract-text",status="200"}' in body
+        assert "ocr_circuit_open 0" in body
     
     def test_extract_text_no_text(self, client, create_test_images):
-        from app.services.ocr import cached_extract
-        cached_extract.cache_clear()
+        from app.services.ocr import result_cache
+        result_cache.clear()
         
         with patch('app.services.ocr._extract_text') as mock_extract:
             mock_extract.return_value = ("", 0.0)
@@ -61,10 +163,12 @@ class TestAPIEndpoints:
         data = response.json()["data"]
         assert data["text"] == ""
         assert data["confidence"] == 0.0
+        assert data["metadata"]["skipped_reason"] == "blank"
+        mock_extract.assert_not_called()
     
     def test_rate_limiting(self, client, create_test_images):
-        from app.services.ocr import cached_extract
-        cached_extract.cache_clear()
+        from app.services.ocr import result_cache
+        result_cache.clear()
         
         with patch('app.services.ocr._extract_text') as mock_extract:
             mock_extract.return_value = ("RATE LIMIT TEST", 0.95)
@@ -81,11 +185,11 @@ class TestAPIEndpoints:
                 assert response.status_code in [200, 429]
     
     def test_batch_extract(self, client, create_test_images):
-        from app.services.ocr import cached_extract
-        cached_extract.cache_clear()
+        from app.services.ocr import result_cache
+        result_cache.clear()
         
-        with patch('app.services.ocr._extract_text') as mock_extract:
-            mock_extract.return_value = ("BATCH TEXT", 0.90)
+        with patch('app.services.ocr._extract_batch') as mock_extract:
+            mock_extract.side_effect = lambda contents: [("BATCH TEXT", 0.90)] * len(contents)
             
             with open(create_test_images / 'test.jpg', "rb") as f:
                 file1_content = f.read()
@@ -102,15 +206,171 @@ class TestAPIEndpoints:
         results = response.json()["data"]["results"]
         assert len(results) == 2
         assert results[0]["text"] == "BATCH TEXT"
+        mock_extract.assert_called_once()
+    
+    def test_full_batch_on_small_cpu_pool(self, client):
+        import io
+        from PIL import Image
+        from app.config import settings
+        from app.services.ocr import result_cache
+        from app.utils.cpu_pool import cpu_pool
+        result_cache.clear()
+        
+        files = []
+        for i in range(settings.batch_max_images):
+            out = io.BytesIO()
+            Image.new("L", (64, 64), i).save(out, format="PNG")
+            files.append(("images", (f"{i}.png", out.getvalue(), "image/png")))
+        with patch('app.services.ocr._extract_batch') as mock_extract, \
+                patch.object(cpu_pool, "size", 1), patch.object(cpu_pool, "max_queue", 0), \
+                patch.object(settings, "blank_check_enabled", False):
+            mock_extract.side_effect = lambda contents: [("TEXT", 0.9)] * len(contents)
+            response = client.post("/batch-extract", files=files)
+        
+        assert response.status_code == 200
+        results = response.json()["data"]["results"]
+        assert len(results) == settings.batch_max_images
+        assert all(result.get("text") == "TEXT" for result in results)
+    
+    def test_batch_extract_partial_failure(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with open(create_test_images / 'test.jpg', "rb") as f:
+            good = f.read()
+        with open(create_test_images / 'corrupt.jpg', "rb") as f:
+            corrupt = f.read()
+        
+        with patch('app.services.ocr._extract_batch') as mock_extract:
+            mock_extract.return_value = [ValueError("quota exceeded")]
+            files = [
+                ("images", ("corrupt.jpg", corrupt, "image/jpeg")),
+                ("images", ("test.jpg", good, "image/jpeg")),
+                ("images", ("copy.jpg", good, "image/jpeg")),
+            ]
+            response = client.post("/batch-extract", files=files)
+        
+        assert response.status_code == 200
+        results = response.json()["data"]["results"]
+        assert "corrupted" in results[0]["error"]
+        assert "quota exceeded" in results[1]["error"]
+        assert results[1] == results[2]
+        assert len(mock_extract.call_args[0][0]) == 1
+    
+    def test_batch_extract_truncated_document(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with patch('app.services.ocr._extract_batch') as mock_extract:
+            mock_extract.side_effect = lambda contents: [("GOOD", 0.9)] * len(contents)
+            files = [
+                ("images", ("test.jpg", (create_test_images / 'test.jpg').read_bytes(), "image/jpeg")),
+                ("images", ("truncated.tiff", (create_test_images / 'truncated.tiff').read_bytes(), "image/tiff")),
+            ]
+            response = client.post("/batch-extract", files=files)
+        
+        assert response.status_code == 200
+        results = response.json()["data"]["results"]
+        assert results[0]["text"] == "GOOD"
+        assert results[1]["error"].startswith("OCR processing failed")
+    
+    def test_batch_extract_ndjson_stream(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with open(create_test_images / 'test.jpg', "rb") as f:
+            good = f.read()
+        with open(create_test_images / 'corrupt.jpg', "rb") as f:
+            corrupt = f.read()
+        
+        with patch('app.services.ocr._extract_batch') as mock_extract:
+            mock_extract.side_effect = lambda contents: [("STREAMED", 0.9)] * len(contents)
+            files = [
+                ("images", ("test.jpg", good, "image/jpeg")),
+                ("images", ("corrupt.jpg", corrupt, "image/jpeg")),
+            ]
+            response = client.post("/batch-extract?stream=ndjson", files=files)
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        by_index = {line["index"]: line for line in lines}
+        assert len(lines) == 2
+        assert "corrupted" in by_index[1]["error"]
+        assert by_index[0]["text"] == "STREAMED"
+        assert by_index[0]["processing_time_ms"] >= 0
+    
+    def test_batch_extract_sse_via_accept(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with open(create_test_images / 'test.jpg', "rb") as f:
+            good = f.read()
+        with patch('app.services.ocr._extract_batch') as mock_extract:
+            mock_extract.side_effect = lambda contents: [("SSE", 0.9)] * len(contents)
+            response = client.post(
+                "/batch-extract",
+                files=[("images", ("test.jpg", good, "image/jpeg"))],
+                headers={"Accept": "text/event-stream"},
+            )
+        
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [e for e in response.text.split("\n\n") if e]
+        assert events[0].startswith("event: result\ndata: ")
+        assert json.loads(events[0].split("data: ", 1)[1])["text"] == "SSE"
+        assert events[-1].startswith("event: done")
+    
+    def test_extract_text_multipage_tiff(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with patch('app.services.ocr._extract_batch') as mock_extract:
+            mock_extract.side_effect = lambda contents: [(f"PAGE", 0.9)] * len(contents)
+            with open(create_test_images / 'multipage.tiff', "rb") as f:
+                response = client.post("/extract-text", files={"image": ("multipage.tiff", f, "image/tiff")})
+        
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert data["metadata"]["frames"] == 3
+        assert [page["page"] for page in data["pages"]] == [1, 2, 3]
+        assert data["text"] == "PAGE PAGE PAGE"
+        assert data["confidence"] == 0.9
+        assert len(mock_extract.call_args[0][0]) == 3
+    
+    def test_extract_text_multipage_stream(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with patch('app.services.ocr._extract_batch') as mock_extract:
+            mock_extract.side_effect = lambda contents: [("PAGE", 0.9)] * len(contents)
+            with open(create_test_images / 'multipage.tiff', "rb") as f:
+                response = client.post(
+                    "/extract-text?stream=ndjson", files={"image": ("multipage.tiff", f, "image/tiff")}
+                )
+        
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(line["page"] for line in lines[:-1]) == [1, 2, 3]
+        assert lines[-1]["text"] == "PAGE PAGE PAGE"
+        assert len(lines[-1]["pages"]) == 3
+    
+    def test_too_many_frames(self, client, create_test_images):
+        from app.config import settings
+        with patch.object(settings, "max_frames", 2):
+            with open(create_test_images / 'multipage.tiff', "rb") as f:
+                response = client.post("/extract-text", files={"image": ("multipage.tiff", f, "image/tiff")})
+        assert response.status_code == 422
+        assert "frames" in response.json()["error"]
     
     def test_batch_limit(self, client, create_test_images):
+        from app.config import settings
         with open(create_test_images / 'test.jpg', "rb") as f:
             file_content = f.read()
         
-        files = [("images", (f"test_{i}.jpg", file_content, "image/jpeg")) for i in range(11)]
-        response = client.post("/batch-extract", files=files)
+        files = [("images", (f"test_{i}.jpg", file_content, "image/jpeg")) for i in range(3)]
+        with patch.object(settings, "batch_max_images", 2):
+            response = client.post("/batch-extract", files=files)
         
         assert response.status_code == 422
         json_response = response.json()
         error_msg = str(json_response.get("error") or json_response.get("detail") or json_response)
-        assert "10" in error_msg or "limit" in error_msg.lower() or "many" in error_msg.lower()
\ No newline at end of file
+        assert "2" in error_msg or "limit" in error_msg.lower() or "many" in error_msg.lower()
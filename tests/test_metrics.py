@@ -0,0 +1,42 @@
+import asyncio
+import pytest
+from app.utils.metrics import Counter, Histogram, Registry, collect_timings, record, stage_seconds, timer
+
+
+class TestMetrics:
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value, stage="ocr")
+        lines = histogram.render()
+        assert 'latency_seconds_bucket{stage="ocr",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{stage="ocr",le="1.0"} 3' in lines
+        assert 'latency_seconds_bucket{stage="ocr",le="+Inf"} 4' in lines
+        assert 'latency_seconds_sum{stage="ocr"} 6.05' in lines
+        assert 'latency_seconds_count{stage="ocr"} 4' in lines
+    
+    def test_registry_renders_help_and_type(self):
+        registry = Registry()
+        counter = registry.register(Counter("errors_total", "Errors.", ("kind",)))
+        counter.inc(kind='say "hi"')
+        text = registry.render()
+        assert "# HELP errors_total Errors.\n# TYPE errors_total counter\n" in text
+        assert 'errors_total{kind="say \\"hi\\""} 1' in text
+    
+    @pytest.mark.asyncio
+    async def test_collect_timings_includes_child_tasks(self):
+        before = stage_seconds.count(stage="child")
+
+        async def child():
+            with timer("child"):
+                await asyncio.sleep(0.01)
+
+        with collect_timings() as timings:
+            record("parent", 0.5)
+            await asyncio.ensure_future(child())
+        record("outside", 1.0)
+
+        assert timings["parent"] == 0.5
+        assert timings["child"] >= 0.01
+        assert "outside" not in timings
+        assert stage_seconds.count(stage="child") == before + 1
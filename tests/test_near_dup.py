@@ -0,0 +1,61 @@
+import random
+import pytest
+from unittest.mock import patch
+from app.services.near_dup import BKTree, NearDuplicateIndex, hamming
+
+class TestBKTree:
+    def test_search_matches_linear_scan(self):
+        rng = random.Random(7)
+        keys = [rng.getrandbits(64) for _ in range(500)]
+        tree = BKTree()
+        for i, key in enumerate(keys):
+            tree.add(key, str(i))
+        
+        query = keys[42] ^ 0b1011
+        expected = sorted((hamming(query, k), str(i)) for i, k in enumerate(keys) if hamming(query, k) <= 6)
+        assert sorted(tree.search(query, 6)) == expected
+
+class TestNearDuplicateIndex:
+    def test_lookup_returns_closest(self):
+        index = NearDuplicateIndex(max_distance=4, max_entries=100)
+        index.add(0b1111_0000, "far")
+        index.add(0b1111_1111, "near")
+        assert index.lookup(0b1111_1110) == "near"
+        assert index.lookup(0b0000_1111_0000_0000) is None
+        stats = index.stats()
+        assert stats["lookups"] == 2
+        assert stats["hits"] == 1
+    
+    def test_bounded_entries(self):
+        index = NearDuplicateIndex(max_distance=0, max_entries=4)
+        for i in range(10):
+            index.add(1 << i, str(i))
+        assert index.stats()["entries"] <= 5
+        assert index.lookup(1 << 9) == "9"
+        assert index.lookup(1 << 0) is None
+
+@pytest.mark.asyncio
+class TestNearDuplicateExtraction:
+    async def test_recompressed_copy_reuses_result(self, create_test_images):
+        import io
+        from PIL import Image
+        from app.config import settings
+        from app.services.ocr import extract, near_duplicates, result_cache
+        result_cache.clear()
+        near_duplicates.clear()
+        
+        original = (create_test_images / "test.jpg").read_bytes()
+        with Image.open(io.BytesIO(original)) as img:
+            out = io.BytesIO()
+            img.resize((300, 150)).save(out, format="JPEG", quality=50)
+        copy = out.getvalue()
+        
+        with patch.object(settings, "near_dup_enabled", True), \
+                patch('app.services.ocr._extract_text', return_value=("HELLO WORLD", 0.95)) as mock_extract:
+            first = await extract("original", original)
+            second = await extract("copy", copy)
+        
+        mock_extract.assert_called_once()
+        assert second["text"] == first["text"]
+        assert second["near_duplicate_of"] == "original"
+        assert near_duplicates.stats()["hits"] == 1
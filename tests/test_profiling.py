@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from app.middleware.profiling import ProfileStore, StackSampler, profiler
+
+
+def busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+@pytest.fixture
+def debug_token(tmp_path):
+    with patch.object(profiler, "token", "secret"), patch.object(profiler.store, "directory", str(tmp_path)):
+        yield {"X-Debug-Token": "secret"}
+
+
+class TestProfiling:
+    def test_sampler_sees_worker_threads(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,), name="busy-worker")
+        worker.start()
+        sampler = StackSampler(interval=0.001)
+        try:
+            for _ in range(20):
+                sampler.sample()
+        finally:
+            stop.set()
+            worker.join()
+        
+        stacks = sampler.collapsed()
+        assert sampler.samples == 20
+        assert any(line.startswith("busy-worker;") and "busy_loop" in line for line in stacks.splitlines())
+    
+    def test_store_keeps_newest_profiles(self, tmp_path):
+        store = ProfileStore(str(tmp_path), max_profiles=3)
+        for i in range(5):
+            store.save({"id": f"p{i}", "stacks": "", "path": "/extract-text"})
+        
+        assert [p["id"] for p in store.list()] == ["p4", "p3", "p2"]
+        assert store.get("p0") is None
+        assert store.get("p3")["path"] == "/extract-text"
+    
+    def test_debug_header_profiles_request(self, client, create_test_images, debug_token):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        
+        with patch('app.services.ocr._extract_text', side_effect=lambda c: time.sleep(0.05) or ("PROFILED", 0.9)):
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                response = client.post("/extract-text", files={"image": ("test.jpg", f)}, headers=debug_token)
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                plain = client.post("/extract-text", files={"image": ("test.jpg", f)})
+        
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in plain.headers
+        profile_id = response.headers["X-Profile-Id"]
+        
+        listed = client.get("/admin/profiles", headers=debug_token).json()["data"]["profiles"]
+        assert [p["id"] for p in listed] == [profile_id]
+        assert listed[0]["reason"] == "header" and listed[0]["status"] == 200
+        
+        download = client.get(f"/admin/profiles/{profile_id}", headers=debug_token)
+        profile = json.loads(download.content)
+        assert profile["samples"] > 0
+        assert "extract_one (ocr.py" in profile["stacks"]
+        assert profile["memory"]["peak_kb"] > 0
+        
+        collapsed = client.get(f"/admin/profiles/{profile_id}?format=collapsed", headers=debug_token)
+        assert collapsed.text == profile["stacks"]
+    
+    def test_sampled_requests(self, client, debug_token):
+        with patch.object(profiler, "sample_rate", 1.0):
+            assert "X-Profile-Id" in client.get("/stats").headers
+            # Probes are never sampled.
+            assert "X-Profile-Id" not in client.get("/health").headers
+    
+    def test_admin_requires_token(self, client, debug_token):
+        assert client.get("/admin/profiles").status_code == 403
+        assert client.get("/admin/profiles", headers={"X-Debug-Token": "wrong"}).status_code == 403
+        non_ascii = {"X-Debug-Token": "caf\xe9".encode("latin-1")}
+        assert client.get("/admin/profiles", headers=non_ascii).status_code == 403
+        assert "X-Profile-Id" not in client.get("/stats", headers=non_ascii).headers
+        assert client.get("/admin/profiles/missing", headers=debug_token).status_code == 404
+    
+    def test_admin_hidden_without_token(self, client):
+        assert client.get("/admin/profiles", headers={"X-Debug-Token": ""}).status_code == 404
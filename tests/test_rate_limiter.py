@@ -0,0 +1,116 @@
+import sqlite3
+import pytest
+from unittest.mock import Mock, patch
+from app.middleware.rate_limiter import MemoryStore, QuotaLimiter, SQLiteStore, parse_rate
+from app.utils.exceptions import RateLimitError
+
+
+def request(host="1.2.3.4"):
+    return Mock(client=Mock(host=host), state=Mock())
+
+
+def upload(size):
+    return Mock(size=size)
+
+
+class TestRateLimiter:
+    def test_parse_rate(self):
+        assert parse_rate("10/minute") == (10.0, 10 / 60)
+        assert parse_rate("5 per second") == (5.0, 5.0)
+        assert parse_rate("100/hours") == (100.0, 100 / 3600)
+
+    def test_cost_counts_images_and_megabytes(self):
+        limiter = QuotaLimiter(MemoryStore(), {"batch": "100/minute"}, mb_per_token=1)
+        assert limiter.cost([upload(1000), upload(None)]) == 2
+        assert limiter.cost([upload(3 * 1024 * 1024 + 1)]) == 4
+
+    def test_bucket_refills_over_time(self):
+        store = MemoryStore()
+        with patch("app.middleware.rate_limiter.time.time", return_value=1000.0):
+            assert store.take("k", 2, capacity=2, rate=1)[0]
+            allowed, tokens, retry_after = store.take("k", 1, capacity=2, rate=1)
+        assert not allowed
+        assert retry_after == 1.0
+        with patch("app.middleware.rate_limiter.time.time", return_value=1001.0):
+            assert store.take("k", 1, capacity=2, rate=1)[0]
+
+    def test_oversized_request_runs_into_debt(self):
+        store = MemoryStore()
+        allowed, tokens, _ = store.take("k", 5, capacity=2, rate=1)
+        assert allowed and tokens == -3
+        assert not store.take("k", 1, capacity=2, rate=1)[0]
+
+    @pytest.mark.parametrize("shared", [False, True])
+    def test_refilled_buckets_are_dropped(self, shared, tmp_path):
+        store = SQLiteStore(str(tmp_path / "rl.sqlite3")) if shared else MemoryStore()
+        with patch.object(store, "PRUNE_EVERY", 3):
+            with patch("app.middleware.rate_limiter.time.time", return_value=1000.0):
+                store.take("idle", 1, capacity=2, rate=1)
+                store.take("busy", 2, capacity=2, rate=0.01)
+            with patch("app.middleware.rate_limiter.time.time", return_value=1010.0):
+                allowed, _, _ = store.take("busy", 1, capacity=2, rate=0.01)
+        assert not allowed
+        if shared:
+            keys = [key for key, in store._db.execute("SELECT key FROM buckets")]
+        else:
+            keys = list(store._buckets)
+        assert keys == ["busy"]
+
+    def test_sqlite_buckets_are_shared(self, tmp_path):
+        # Two stores on one file behave like two workers on one host.
+        first, second = SQLiteStore(str(tmp_path / "rl.sqlite3")), SQLiteStore(str(tmp_path / "rl.sqlite3"))
+        assert first.take("client", 1, capacity=2, rate=0.01)[0]
+        assert second.take("client", 1, capacity=2, rate=0.01)[0]
+        assert not first.take("client", 1, capacity=2, rate=0.01)[0]
+        assert second.take("other", 1, capacity=2, rate=0.01)[0]
+
+    def test_sqlite_store_fails_open_to_local_buckets(self, tmp_path):
+        store = SQLiteStore(str(tmp_path / "rl.sqlite3"))
+        store._db = Mock(execute=Mock(side_effect=sqlite3.OperationalError("database is locked")))
+        assert store.take("client", 1, capacity=1, rate=0.01)[0]
+        assert not store.take("client", 1, capacity=1, rate=0.01)[0]
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("shared", [False, True])
+    async def test_check_raises_with_headers(self, shared, tmp_path):
+        store = SQLiteStore(str(tmp_path / "rl.sqlite3")) if shared else MemoryStore()
+        limiter = QuotaLimiter(store, {"extract": "2/minute"}, mb_per_token=1)
+        quota = await limiter.check(request(), "extract", [upload(10)])
+        assert quota.headers()["X-RateLimit-Remaining"] == "1"
+        await limiter.check(request(), "extract", [upload(10)])
+        with pytest.raises(RateLimitError) as exc_info:
+            await limiter.check(request(), "extract", [upload(10)])
+        assert exc_info.value.headers["Retry-After"] == "30"
+        assert exc_info.value.headers["X-RateLimit-Remaining"] == "0"
+        # Other clients have their own bucket.
+        assert (await limiter.check(request("5.6.7.8"), "extract", [upload(10)])).allowed
+
+
+class TestRateLimitEndpoints:
+    def test_quota_headers_and_429(self, client, create_test_images):
+        from app.services.ocr import result_cache
+        result_cache.clear()
+        with patch('app.services.ocr._extract_text', return_value=("QUOTA", 0.9)):
+            for i in range(10):
+                with open(create_test_images / 'test.jpg', "rb") as f:
+                    response = client.post("/extract-text", files={"image": (f"test_{i}.jpg", f)})
+                assert response.status_code == 200
+                assert response.headers["X-RateLimit-Remaining"] == str(9 - i)
+
+            with open(create_test_images / 'test.jpg', "rb") as f:
+                response = client.post("/extract-text", files={"image": ("test.jpg", f)})
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert response.json()["error"] == "Rate limit exceeded, please retry later."
+
+    def test_batch_charged_per_image(self, client, create_test_images):
+        from app.middleware.rate_limiter import limiter
+        with open(create_test_images / 'test.jpg', "rb") as f:
+            good = f.read()
+        with patch.dict(limiter.limits, {"batch": parse_rate("3/minute")}), \
+                patch('app.services.ocr._extract_batch', side_effect=lambda cs: [("X", 0.9)] * len(cs)):
+            files = [("images", (f"{i}.jpg", good, "image/jpeg")) for i in range(3)]
+            assert client.post("/batch-extract", files=files).status_code == 200
+            response = client.post("/batch-extract", files=files[:1])
+        assert response.status_code == 429
@@ -0,0 +1,119 @@
+import asyncio
+import time
+import pytest
+from app.services.resilience import CircuitBreaker, ResilientBackend, RetryBudget
+from app.utils import deadline
+from app.utils.exceptions import ServiceUnavailableError
+
+
+class Transient(Exception):
+    pass
+
+
+def make_backend(attempts=3, reserve=10, threshold=5, reset=30.0, hedge=False):
+    return ResilientBackend(
+        "test backend", lambda e: isinstance(e, Transient), attempts=attempts,
+        base_delay=0, max_delay=0, budget=RetryBudget(0.2, reserve),
+        breaker=CircuitBreaker(threshold, reset), hedge=hedge, hedge_min_samples=5,
+    )
+
+
+def flaky(failures: list[Exception], result="ok"):
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return result
+    return attempt, calls
+
+
+@pytest.mark.asyncio
+class TestResilientBackend:
+    async def test_retries_transient_errors(self):
+        backend = make_backend()
+        attempt, calls = flaky([Transient("unavailable"), Transient("unavailable")])
+        assert await backend.call("single", attempt) == "ok"
+        assert len(calls) == 3
+        assert backend.stats()["retries"] == 2
+
+    async def test_does_not_retry_permanent_errors(self):
+        backend = make_backend()
+        attempt, calls = flaky([ValueError("invalid argument")])
+        with pytest.raises(ValueError):
+            await backend.call("single", attempt)
+        assert len(calls) == 1
+        assert backend.breaker.state == "closed"
+
+    async def test_retry_budget_limits_retries(self):
+        backend = make_backend(reserve=1)
+        attempt, calls = flaky([Transient("a"), Transient("b"), Transient("c")])
+        with pytest.raises(Transient):
+            await backend.call("single", attempt)
+        assert len(calls) == 2
+        assert backend.stats()["retries_denied"] == 1
+
+    async def test_breaker_opens_and_fails_fast(self):
+        backend = make_backend(attempts=1, threshold=2)
+        for _ in range(2):
+            attempt, _ = flaky([Transient("down")])
+            with pytest.raises(Transient):
+                await backend.call("single", attempt)
+
+        attempt, calls = flaky([])
+        with pytest.raises(ServiceUnavailableError) as exc_info:
+            await backend.call("single", attempt)
+        assert not calls
+        assert int(exc_info.value.headers["Retry-After"]) >= 1
+        assert backend.health() == {"circuit": "open", "consecutive_failures": 2}
+
+    async def test_breaker_half_open_probe_closes(self):
+        backend = make_backend(attempts=1, threshold=1, reset=0.01)
+        attempt, _ = flaky([Transient("down")])
+        with pytest.raises(Transient):
+            await backend.call("single", attempt)
+        await asyncio.sleep(0.02)
+
+        attempt, calls = flaky([])
+        assert await backend.call("single", attempt) == "ok"
+        assert backend.breaker.state == "closed"
+
+    async def test_failures_past_caller_deadline_do_not_open_breaker(self):
+        backend = make_backend(attempts=3, threshold=1)
+        attempt, calls = flaky([Transient("deadline exceeded")])
+        with deadline.deadline(0):
+            with pytest.raises(Transient):
+                await backend.call("single", attempt)
+        assert len(calls) == 1
+        assert backend.health() == {"circuit": "closed", "consecutive_failures": 0}
+
+    async def test_hedges_slow_calls(self):
+        backend = make_backend(hedge=True)
+        for _ in range(5):
+            await backend.call("single", flaky([])[0])
+
+        started = []
+
+        async def attempt():
+            started.append(1)
+            # The first call hangs; the hedge answers at once.
+            if len(started) == 1:
+                await asyncio.sleep(5)
+            return "hedged"
+
+        begin = time.perf_counter()
+        assert await backend.call("single", attempt) == "hedged"
+        assert time.perf_counter() - begin < 1
+        assert len(started) == 2
+        assert backend.stats()["hedge_wins"] == 1
+
+
+class TestCircuitBreaker:
+    def test_only_one_probe_when_half_open(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+        breaker.record_failure()
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
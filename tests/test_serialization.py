@@ -0,0 +1,24 @@
+import json
+from fractions import Fraction
+from unittest.mock import patch
+from app.utils import serialization
+from app.utils.serialization import FastJSONResponse, dumps, envelope
+
+
+class TestSerialization:
+    def test_dumps_encodes_exif_types(self):
+        body = json.loads(dumps({"blob": b"\x00" * 10, "ratio": Fraction(1, 4), 7: (1, 2), "text": "é"}))
+        assert body == {"blob": "<10 bytes>", "ratio": 0.25, "7": [1, 2], "text": "é"}
+    
+    def test_stdlib_fallback_matches(self):
+        content = {"blob": b"xy", "ratio": Fraction(3, 2), "size": (4, 5), "nested": {"a": [1.5, None]}}
+        fast = json.loads(dumps(content))
+        with patch.object(serialization, "orjson", None):
+            assert json.loads(dumps(content)) == fast
+    
+    def test_envelope_response(self):
+        response = FastJSONResponse(envelope({"text": "hi"}))
+        assert json.loads(response.body) == {
+            "success": True, "status_code": 200, "data": {"text": "hi"}, "error": "",
+        }
+        assert envelope(None, 422, "bad")["success"] is False
@@ -1,47 +1,198 @@
 
+import asyncio
+import time
 import pytest
 from unittest.mock import patch, Mock, MagicMock
-from app.services.ocr import cached_extract, _extract_text
+from app.services.ocr import (
+    _extract_text, _extract_batch, get_client, close_client, extract, get_stats, result_cache, BatchScheduler,
+    warm_up,
+)
+from app.utils import deadline
 
 class TestOCRService:
-    def test_cached_extract(self):
+    @pytest.mark.asyncio
+    async def test_cached_extract(self):
+        result_cache.clear()
         with patch('app.services.ocr._extract_text') as mock_extract:
             mock_extract.return_value = ("cached text", 0.95)
             
-            result1 = cached_extract("hash123", b"image")
-            result2 = cached_extract("hash123", b"image")
-            assert result1 == result2
+            result1 = await extract("hash123", b"image")
+            result2 = await extract("hash123", b"image")
+            assert result1 == result2 == {"text": "cached text", "confidence": 0.95}
             mock_extract.assert_called_once()
     
-    @patch('app.services.ocr.vision.ImageAnnotatorClient')
-    def test_ocr_success(self, mock_client):
+    @patch('app.services.ocr.get_client')
+    def test_ocr_success(self, mock_client, vision_response):
         mock_instance = Mock()
         mock_client.return_value = mock_instance
+        mock_instance.document_text_detection.return_value = vision_response(
+            "SUCCESS", [("SUCCESS", [0.95] * 7, (10, 20, 110, 40))]
+        )
         
-        mock_response = Mock()
-        mock_response.error.message = "" 
-        mock_response.full_text_annotation = Mock(text="SUCCESS")
-        mock_response.full_text_annotation.pages = [
-            Mock(blocks=[Mock(paragraphs=[Mock(words=[Mock(symbols=[
-                Mock(confidence=0.95)
-            ])])])])
-        ]
-        mock_instance.document_text_detection.return_value = mock_response
-        
-        text, confidence = _extract_text(b"image")
+        text, confidence, layout = _extract_text(b"image")
         assert text == "SUCCESS"
         assert confidence > 0
+        assert layout["words"]["text"] == ["SUCCESS"]
     
-    @patch('app.services.ocr.vision.ImageAnnotatorClient')
-    def test_ocr_no_text(self, mock_client):
+    @patch('app.services.ocr.get_client')
+    def test_ocr_no_text(self, mock_client, mock_vision_empty):
         mock_instance = Mock()
         mock_client.return_value = mock_instance
+        mock_instance.document_text_detection.return_value = mock_vision_empty
         
-        mock_response = Mock()
-        mock_response.error.message = ""  
-        mock_response.full_text_annotation = None
-        mock_instance.document_text_detection.return_value = mock_response
-        
-        text, confidence = _extract_text(b"image")
+        text, confidence, layout = _extract_text(b"image")
         assert text == ""
-        assert confidence == 0.0
\ No newline at end of file
+        assert confidence == 0.0
+        assert layout["words"]["text"] == []
+    
+    @patch('google.cloud.vision.ImageAnnotatorClient')
+    def test_client_reused(self, mock_client):
+        close_client()
+        try:
+            assert get_client() is get_client()
+            mock_client.assert_called_once()
+        finally:
+            close_client()
+        mock_client.return_value.transport.close.assert_called_once()
+    
+    @patch('google.cloud.vision.ImageAnnotatorClient')
+    def test_warm_up_creates_client(self, mock_client):
+        close_client()
+        try:
+            warm_up(timeout=0.1)
+            mock_client.assert_called_once()
+        finally:
+            close_client()
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_images_coalesced(self):
+        result_cache.clear()
+        before = get_stats()["coalesced"]
+
+        def slow_extract(content):
+            time.sleep(0.1)
+            return ("shared text", 0.9)
+
+        with patch('app.services.ocr._extract_text', side_effect=slow_extract) as mock_extract:
+            results = await asyncio.gather(*[extract("same-hash", b"image") for _ in range(5)])
+
+        assert all(r == {"text": "shared text", "confidence": 0.9} for r in results)
+        mock_extract.assert_called_once()
+        stats = get_stats()
+        assert stats["coalesced"] - before == 4
+        assert stats["in_flight"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_coalesced_call_outlives_owner_deadline(self):
+        result_cache.clear()
+        seen = []
+
+        def slow_extract(content):
+            seen.append(deadline.remaining())
+            time.sleep(0.1)
+            return ("shared text", 0.9)
+
+        async def impatient():
+            with deadline.deadline(0.02):
+                return await extract("deadline-hash", b"image")
+
+        with patch('app.services.ocr._extract_text', side_effect=slow_extract):
+            owner = asyncio.ensure_future(impatient())
+            await asyncio.sleep(0)
+            patient = await extract("deadline-hash", b"image")
+            with pytest.raises(asyncio.TimeoutError):
+                await owner
+
+        assert patient == {"text": "shared text", "confidence": 0.9}
+        assert seen == [None]
+
+    @pytest.mark.asyncio
+    async def test_scheduler_groups_requests_into_one_batch(self):
+        result_cache.clear()
+        scheduler = BatchScheduler(max_batch_size=16, max_wait_ms=50)
+
+        def batch(contents):
+            return [(c.decode(), 0.9) if c != b"bad" else ValueError("bad image") for c in contents]
+
+        with patch('app.services.ocr._scheduler', scheduler), \
+                patch('app.services.ocr._extract_batch', side_effect=batch) as mock_batch:
+            results = await asyncio.gather(
+                extract("h1", b"one"), extract("h2", b"two"), extract("h3", b"bad"),
+                return_exceptions=True,
+            )
+
+        mock_batch.assert_called_once()
+        assert results[0] == {"text": "one", "confidence": 0.9}
+        assert results[1] == {"text": "two", "confidence": 0.9}
+        assert isinstance(results[2], ValueError)
+        assert result_cache.get("h1") == {"text": "one", "confidence": 0.9}
+        assert scheduler.batches == 1
+    
+    def test_scheduler_respects_max_batch_size(self):
+        scheduler = BatchScheduler(max_batch_size=2, max_wait_ms=1000)
+        with patch('app.services.ocr._extract_batch', side_effect=lambda cs: [("x", 0.5)] * len(cs)) as mock_batch:
+            futures = [scheduler.submit(b"img") for _ in range(4)]
+            assert all(f.result(timeout=5) == ("x", 0.5) for f in futures)
+        assert mock_batch.call_count == 2
+    
+    @patch('app.services.ocr.get_client')
+    def test_extract_batch(self, mock_client, mock_vision_success, mock_vision_empty):
+        from google.cloud import vision
+        error = vision.AnnotateImageResponse(error={"message": "bad image"})
+        mock_client.return_value.batch_annotate_images.return_value = vision.BatchAnnotateImagesResponse(
+            responses=[mock_vision_success, mock_vision_empty, error]
+        )
+        results = _extract_batch([b"a", b"b", b"c"])
+        assert results[0][:2] == ("HELLO WORLD OCR API", 0.95)
+        assert results[1][:2] == ("", 0.0)
+        assert isinstance(results[2], ValueError)
+    
+    @pytest.mark.asyncio
+    async def test_layout_cached_apart_from_text(self):
+        from app.services.ocr import layout_cache
+        result_cache.clear()
+        layout = {"pages": [], "words": {"text": ["HELLO"]}}
+        with patch('app.services.ocr._extract_text', return_value=("HELLO", 0.9, layout)) as mock_extract:
+            first = await extract("layout-hash", b"image")
+            assert first["layout"] == layout
+            assert "layout" not in result_cache.get("layout-hash")
+            assert "layout" not in await extract("layout-hash", b"image")
+            assert (await extract("layout-hash", b"image", layout=True))["layout"] == layout
+            assert mock_extract.call_count == 1
+            
+            # An evicted layout is read again.
+            layout_cache.clear()
+            assert (await extract("layout-hash", b"image", layout=True))["layout"] == layout
+            assert mock_extract.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_preprocess_shrinks_payload(self, create_test_images):
+        from app.config import settings
+        result_cache.clear()
+        content = (create_test_images / 'test.jpg').read_bytes()
+        with patch.object(settings, "vision_preprocess", True), \
+                patch.object(settings, "vision_max_side", 100), \
+                patch('app.services.ocr._extract_text', return_value=("HELLO", 0.9)) as mock_extract:
+            result = await extract("preprocessed", content)
+            cached = await extract("preprocessed", content)
+        
+        payload = mock_extract.call_args[0][0]
+        assert len(payload) < len(content)
+        assert result["bytes_saved"] == len(content) - len(payload)
+        assert cached == {"text": "HELLO", "confidence": 0.9}
+    
+    @pytest.mark.asyncio
+    async def test_transient_errors_retried_permanent_not(self):
+        from google.api_core import exceptions as api_exceptions
+        result_cache.clear()
+        with patch('app.services.ocr.backend.base_delay', 0), \
+                patch('app.services.ocr._extract_text',
+                      side_effect=[api_exceptions.ServiceUnavailable("busy"), ("retried", 0.8)]) as mock_extract:
+            assert await extract("transient", b"image") == {"text": "retried", "confidence": 0.8}
+        assert mock_extract.call_count == 2
+
+        with patch('app.services.ocr._extract_text',
+                   side_effect=api_exceptions.InvalidArgument("bad image")) as mock_extract:
+            with pytest.raises(api_exceptions.InvalidArgument):
+                await extract("permanent", b"image")
+        mock_extract.assert_called_once()
@@ -1,3 +1,4 @@
+import hashlib
 import pytest
 from io import BytesIO
 from starlette.datastructures import UploadFile as StarletteUploadFile
@@ -17,9 +18,10 @@ class TestValidators:
             file=BytesIO(content),
             headers=headers
         )
-        validated_content, metadata = await validate_image(file)
+        validated_content, metadata, digest = await validate_image(file)
         
-        assert len(validated_content) > 0
+        assert validated_content == content
+        assert digest == hashlib.sha256(content).hexdigest()
         assert metadata["format"] in ["JPEG", "JPG"]
         assert metadata["size"] == (400, 200)
     
@@ -62,6 +64,76 @@ class TestValidators:
         with pytest.raises(ValidationError, match="corrupted"):
             await validate_image(file)
     
+    async def test_valid_png(self, create_test_images):
+        with open(create_test_images / 'blank.png', 'rb') as f:
+            content = f.read()
+        
+        file = StarletteUploadFile(
+            filename="blank.png",
+            file=BytesIO(content),
+            headers=Headers({"content-type": "image/png"})
+        )
+        _, metadata, _ = await validate_image(file)
+        
+        assert metadata["format"] == "PNG"
+        assert metadata["size"] == (100, 100)
+        assert metadata["exif"] == {}
+    
+    async def test_truncated_png(self, create_test_images):
+        with open(create_test_images / 'blank.png', 'rb') as f:
+            content = f.read()
+        
+        file = StarletteUploadFile(
+            filename="blank.png",
+            file=BytesIO(content[:len(content) // 2]),
+            headers=Headers({"content-type": "image/png"})
+        )
+        with pytest.raises(ValidationError, match="corrupted"):
+            await validate_image(file)
+    
+    async def test_too_large_stops_reading(self):
+        stream = BytesIO(b'A' * 50_000_000)
+        file = StarletteUploadFile(
+            filename="huge.jpg",
+            file=stream,
+            headers=Headers({"content-type": "image/jpeg"})
+        )
+        with pytest.raises(ValidationError, match="exceeds"):
+            await validate_image(file)
+        assert stream.tell() < 50_000_000
+    
+    async def test_declared_size_rejected_before_reading(self):
+        stream = BytesIO(b'A' * 100)
+        file = StarletteUploadFile(
+            filename="huge.jpg",
+            file=stream,
+            size=50_000_000,
+            headers=Headers({"content-type": "image/jpeg"})
+        )
+        with pytest.raises(ValidationError, match="exceeds"):
+            await validate_image(file)
+        assert stream.tell() == 0
+    
+    async def test_exif_made_json_ready(self):
+        from PIL import Image
+        from PIL.TiffImagePlugin import IFDRational
+        exif = Image.Exif()
+        exif[0x010E] = "scan"  # ImageDescription
+        exif[0x011A] = IFDRational(300, 1)  # XResolution
+        exif[0x927C] = b"\x01" * 1000  # MakerNote
+        out = BytesIO()
+        Image.new("RGB", (40, 20), "white").save(out, format="JPEG", exif=exif)
+        file = StarletteUploadFile(
+            filename="exif.jpg",
+            file=BytesIO(out.getvalue()),
+            headers=Headers({"content-type": "image/jpeg"})
+        )
+        _, metadata, _ = await validate_image(file)
+        
+        assert metadata["exif"]["ImageDescription"] == "scan"
+        assert metadata["exif"]["XResolution"] == 300.0
+        assert metadata["exif"]["MakerNote"] == "<1000 bytes>"
+    
     def test_preprocess_text(self):
         text = "  Hello\nWorld  <script>evil</script>  "
         cleaned = preprocess_text(text)